@@ -0,0 +1,79 @@
+import traceback
+from engine import Engine, STEP
+from logsink import flushSinks
+
+# --- GLOBAL VARIABLES ---
+
+LOG_FLUSH_INTERVAL = 1.0 # seconds between writes of the output files (0 writes and flushes each line at once)
+TRACE_FORMAT = "csv" # per-step trace: "csv" for control.csv, "npz" for typed columns in control.npz
+TRACE_CHECKPOINT = 0 # rows between two writes of control.npz, so that a crashed simulation keeps its trace (0: at exit or on error only)
+
+# PARAMS (to be decided by user)
+PRESET = "APCS5" # controller variant, one of engine.PRESETS (APCS1..APCS6, OPTIMAL)
+PARAMETERS = {} # overrides of the parameters of the preset, e.g. {"PV_SPAN_MIN": 1.0} (see engine.PARAMETERS)
+# other units of the deck running this script, by unit number: {"preset": ..., "directory": ..., "parameters": {...}}.
+# directory: of the input and output files of the unit (default "unit<number>"); preset and parameters as above
+UNITS = {}
+
+# controller driven by TRNSYS (the unit importing the script), see newEngine
+ENGINE = None
+
+
+# --- END OF GLOBAL VARIABLES ---
+
+# function called by TRNSYS (Type169), with the state of its unit (see createUnit)
+def main(unit=None):
+   unit = unit or UNIT
+   try:
+      timestep = TRNSYS.getSimulationTime() # requires modified Type169 that allows to read the timestep in the Python environment
+      if unit.inputs is not None:
+         for i, value in enumerate(unit.engine.step(timestep, unit.inputs)):
+            unit.outputs[i] = value
+      elif BULK:
+         TRNSYS.setOutputValues(unit.engine.step(timestep, TRNSYS.getInputValues()))
+      else:
+         outputs = unit.engine.step(timestep, [TRNSYS.getInputValue(i) for i in range(1, unit.engine.inputs + 1)])
+         for i, value in enumerate(outputs, 1):
+            TRNSYS.setOutputValue(i, value)
+
+   except Exception as err:
+      unit.engine.log(traceback.format_exc()) # logs error
+      flushSinks() # the buffered output files are complete up to the error
+      raise err
+
+# controller of one unit of the deck: its engine and the exchange of its inputs and outputs with the bridge
+# (Type1691.cpp): through views of the unit's input and output arrays, else in one call each (BULK), else one call per value
+class Unit:
+   __slots__ = ("engine", "inputs", "outputs")
+
+   def __init__(self, engine):
+      self.engine = engine
+      self.inputs = TRNSYS.getInputBuffer() if hasattr(TRNSYS, "getInputBuffer") else None
+      self.outputs = TRNSYS.getOutputBuffer() if hasattr(TRNSYS, "getOutputBuffer") else None
+
+# engine of a unit. With the context of the bridge (Type1691.cpp), the horizons end at the stop time of the simulation
+# unless SIMUL_END is given, and the time step of the deck must be the STEP of the engine
+def newEngine(preset, directory, parameters):
+   if CONTEXT is not None:
+      if abs(CONTEXT.timestep - STEP) > 1e-9:
+         raise ValueError("the time step of the deck (%g h) is not the one of the controller (%g h)" % (CONTEXT.timestep, STEP))
+      parameters = dict({"SIMUL_END": CONTEXT.stop}, **parameters)
+   return Engine(preset, directory, TRACE_FORMAT, LOG_FLUSH_INTERVAL, TRACE_CHECKPOINT, **parameters)
+
+# called by the bridge at the start time of each unit running this script, returns the state main() is called with
+def createUnit(unit):
+   if unit == FIRST_UNIT:
+      return UNIT
+   if unit not in UNITS:
+      raise ValueError("unit %d runs APCS.py but has no entry in UNITS" % unit)
+   config = UNITS[unit]
+   return Unit(newEngine(config.get("preset", PRESET), config.get("directory", "unit%d" % unit), config.get("parameters", {})))
+
+import TRNSYSpy as TRNSYS
+BULK = hasattr(TRNSYS, "getInputValues")
+FIRST_UNIT = TRNSYS.getCurrentUnit() if hasattr(TRNSYS, "getCurrentUnit") else None
+CONTEXT = TRNSYS.getContext() if hasattr(TRNSYS, "getContext") else None
+# APCS1.py..APCS6.py run this script with their own preset
+PRESET = globals().get("SCRIPT_PRESET", PRESET)
+ENGINE = newEngine(PRESET, ".", PARAMETERS)
+UNIT = Unit(ENGINE)
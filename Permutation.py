@@ -1,6 +1,13 @@
 from numpy import arange
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import collections
+import itertools
+import argparse
+import time
+import json
 import csv
-import sys
+import os
 
 # UTILS
 def fix(parameter, *values):
@@ -9,6 +16,18 @@ def fix(parameter, *values):
         parameter.append(value)
 def init(min, max, step):
     return arange(min, max+step, step).tolist()
+def number(text):
+    return float(text) if "." in text else int(text)
+# canonical value of a constant: rounded to 10 decimals (drops the float error of arange) and integral values as int,
+# so that a design point has one value whichever way it was given (15 and 15.0, 3.3000000000000003 and 3.3)
+def canonical(value):
+    value = round(value, 10)
+    return int(value) if float(value).is_integer() else value
+# number format of the printed temperatures, hysteresis format, and whether printing is coarser than step
+# (then different hystereses can print the same)
+def formats(step):
+    n_format = "%d" if isinstance(step, int) or step.is_integer() else "%.1f"
+    return n_format, "%s-%s" % (n_format, n_format), step < (1 if n_format == "%d" else 0.1)
 
 # TEMPERATURE SEARCH STEP
 step = 1
@@ -36,36 +55,417 @@ def C3(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return A_UP - B_LOW < dT_AB
 def C4(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return dT_CD > 0
 def C5(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return V_MIX_TSP > Tmin_SFC + dT_CD
 def C6(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return V_MIX_TSP < Tmax_SFC - dT_CD
-def C7(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return B_LOW-(A_UP-dT_AB) >= min_HYS and B_LOW+dT_AB-A_UP >= min_HYS
-def C8(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return V_MIX_TSP-dT_CD-Tmin_SFC >= min_HYS and Tmax_SFC-(V_MIX_TSP+dT_CD) >= min_HYS
+# C7 and C8 combine with & instead of `and` so that they also work on numpy arrays (see numpy_search)
+def C7(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return (B_LOW-(A_UP-dT_AB) >= min_HYS) & (B_LOW+dT_AB-A_UP >= min_HYS)
+def C8(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD): return (V_MIX_TSP-dT_CD-Tmin_SFC >= min_HYS) & (Tmax_SFC-(V_MIX_TSP+dT_CD) >= min_HYS)
 
 # SEARCH ALGORITHM
 CONSTRAINTS = [C0, C1, C2, C3, C4, C5, C6, C7, C8]
-solutions = []
-hystereses = set()
-n_format = "%d" if isinstance(step, int) or step.is_integer() else "%.1f"
-h_format = "%s-%s" % (n_format, n_format)
-
-for A_UP in A_UPs:
-    for B_LOW in B_LOWs:
-        for dT_AB in dT_ABs:
-            for V_MIX_TSP in V_MIX_TSPs:
-                for dT_CD in dT_CDs:
-                    candidate = (A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD)
-                    if all([CONSTRAINT(*candidate) for CONSTRAINT in CONSTRAINTS]):
-                        A = h_format % (A_UP-dT_AB, B_LOW)
-                        B = h_format % (B_LOW+dT_AB, A_UP)
-                        C = h_format % (Tmin_SFC, V_MIX_TSP-dT_CD)
-                        D = h_format % (Tmax_SFC, V_MIX_TSP+dT_CD)
-                        hysteresis = (A, B, C, D)
-                        if hysteresis not in hystereses:
-                            solutions.append(candidate + hysteresis)
-                            hystereses.add(hysteresis)
-
-# FILE CREATION
-filename = (sys.argv[1] if len(sys.argv) > 1 else 'data') + '.csv'
-with open(filename, mode='w', newline='') as csv_file:
-    writer = csv.writer(csv_file, delimiter=';')
-    writer.writerow(["A_UP", "B_LOW", "dt_AB", "V_MIX_TSP", "dT_CD", "A", "B", "C", "D"])
-    writer.writerows(solutions)
-print("solution count: ", len(solutions))
+# max number of grid points evaluated at once by the numpy engine (bounds memory)
+CHUNK_SIZE = 2**24
+n_format, h_format, LOSSY = formats(step)
+HEADER = ["A_UP", "B_LOW", "dt_AB", "V_MIX_TSP", "dT_CD", "A", "B", "C", "D"]
+
+# ENGINES
+# each engine yields the feasible candidates of the given outer (A_UP, B_LOW) ranges in loop order,
+# by default the whole current search ranges (read at call time, so that they follow configure)
+
+# the given outer ranges, or the current ones
+def outer(A_UPs, B_LOWs):
+    return (globals()["A_UPs"] if A_UPs is None else A_UPs), (globals()["B_LOWs"] if B_LOWs is None else B_LOWs)
+
+# reference engine: one python call per constraint and per grid point
+def loop_search(A_UPs=None, B_LOWs=None):
+    A_UPs, B_LOWs = outer(A_UPs, B_LOWs)
+    for A_UP in A_UPs:
+        for B_LOW in B_LOWs:
+            for dT_AB in dT_ABs:
+                for V_MIX_TSP in V_MIX_TSPs:
+                    for dT_CD in dT_CDs:
+                        candidate = (A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD)
+                        if all([CONSTRAINT(*candidate) for CONSTRAINT in CONSTRAINTS]):
+                            yield candidate
+
+# and-combines the constraint masks, always merging the pair with the smallest broadcast shape first.
+# constraints only depend on 2 or 3 variables, so the full-size mask is only built by the last merge,
+# and it is not built at all (None is returned) as soon as a partial mask is empty
+def combine(masks):
+    masks = list(masks)
+    if not all(mask.any() for mask in masks):
+        return None
+    while len(masks) > 1:
+        pairs = [(i, j) for i in range(len(masks)) for j in range(i+1, len(masks))]
+        i, j = min(pairs, key=lambda p: np.prod(np.broadcast_shapes(masks[p[0]].shape, masks[p[1]].shape)))
+        merged = masks[i] & masks[j]
+        masks = [m for k, m in enumerate(masks) if k not in (i, j)] + [merged]
+        if len(masks) > 1 and not merged.any():
+            return None
+    return masks[0]
+
+# vectorized engine: evaluates C0..C8 as boolean masks over broadcast grids, one chunk at a time: a block of B_LOWs
+# for one A_UP, or a block of dT_ABs for one (A_UP, B_LOW) when the grid of one B_LOW is already above CHUNK_SIZE.
+# np.nonzero returns the feasible points in C order, which is the iteration order of loop_search
+def numpy_search(A_UPs=None, B_LOWs=None):
+    A_UPs, B_LOWs = outer(A_UPs, B_LOWs)
+    grids = [np.array(values) for values in (A_UPs, B_LOWs, dT_ABs, V_MIX_TSPs, dT_CDs)]
+    cd_size = len(V_MIX_TSPs) * len(dT_CDs)
+    if len(dT_ABs) * cd_size <= CHUNK_SIZE:
+        b_block, d_block = CHUNK_SIZE // (len(dT_ABs) * cd_size), len(dT_ABs)
+    else:
+        b_block, d_block = 1, max(1, CHUNK_SIZE // cd_size)
+    V_MIX_TSP, dT_CD = grids[3].reshape(1, 1, 1, -1, 1), grids[4].reshape(1, 1, 1, 1, -1)
+    for a in range(len(A_UPs)):
+        A_UP = grids[0][a:a+1].reshape(-1, 1, 1, 1, 1)
+        for b_start in range(0, len(B_LOWs), b_block):
+            B_LOW = grids[1][b_start:b_start+b_block].reshape(1, -1, 1, 1, 1)
+            for d_start in range(0, len(dT_ABs), d_block):
+                dT_AB = grids[2][d_start:d_start+d_block].reshape(1, 1, -1, 1, 1)
+                mask = combine(np.asarray(CONSTRAINT(A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD)) for CONSTRAINT in CONSTRAINTS)
+                if mask is None:
+                    continue
+                _, ib, idt_ab, iv, idt_cd = np.nonzero(mask)
+                yield from zip([A_UPs[a]] * len(ib),
+                               map(B_LOWs.__getitem__, (ib + b_start).tolist()),
+                               map(dT_ABs.__getitem__, (idt_ab + d_start).tolist()),
+                               map(V_MIX_TSPs.__getitem__, iv.tolist()),
+                               map(dT_CDs.__getitem__, idt_cd.tolist()))
+
+# C0..C8 split into two groups that do not share any variable:
+# (A_UP, B_LOW, dT_AB) with C0, C1, C2, C3, C7 and (V_MIX_TSP, dT_CD) with C4, C5, C6, C8
+GROUPS = [[C0, C1, C2, C3, C7], [C4, C5, C6, C8]]
+
+# bounds of the innermost variable of each group, derived from the inequalities of the group.
+# strict inequalities are returned as closed bounds: the constraints are checked again on the enumerated sub-range
+def dT_AB_bounds(A_UP, B_LOW):
+    lo = max(0, A_UP - B_LOW, A_UP - B_LOW + min_HYS) # C0, C3, C7
+    hi = min(A_UP - Tmin_SFC - dt_HX, Tmax_SFC - dt_HX - B_LOW) # C1, C2
+    return lo, hi
+
+def dT_CD_bounds(V_MIX_TSP):
+    lo = 0 # C4
+    hi = min(V_MIX_TSP - Tmin_SFC, Tmax_SFC - V_MIX_TSP) - max(0, min_HYS) # C5, C6, C8
+    return lo, hi
+
+# values of the sorted grid within [lo, hi] that satisfy all the constraints of the group,
+# candidate(sub) places the sub-range among the other (fixed) variables
+def feasible(values, lo, hi, constraints, candidate):
+    grid = np.asarray(values)
+    start, stop = np.searchsorted(grid, [lo - step/2, hi + step/2])
+    if start >= stop:
+        return []
+    sub = grid[start:stop]
+    mask = np.ones(len(sub), dtype=bool)
+    for CONSTRAINT in constraints:
+        mask &= CONSTRAINT(*candidate(sub))
+    return [values[k] for k in (np.nonzero(mask)[0] + start).tolist()]
+
+# pruned engine: each group is scanned on its own, enumerating only the bounded sub-range of its innermost variable,
+# then the groups are joined. (A_UP, B_LOW, dT_AB) come first in the loop order, so the join keeps the order of loop_search
+def pruned_search(A_UPs=None, B_LOWs=None):
+    A_UPs, B_LOWs = outer(A_UPs, B_LOWs)
+    AB, CD = GROUPS
+    rows_AB = []
+    for A_UP in A_UPs:
+        for B_LOW in B_LOWs:
+            lo, hi = dT_AB_bounds(A_UP, B_LOW)
+            for dT_AB in feasible(dT_ABs, lo, hi, AB, lambda sub: (A_UP, B_LOW, sub, None, None)):
+                rows_AB.append((A_UP, B_LOW, dT_AB))
+    rows_CD = []
+    for V_MIX_TSP in V_MIX_TSPs:
+        lo, hi = dT_CD_bounds(V_MIX_TSP)
+        for dT_CD in feasible(dT_CDs, lo, hi, CD, lambda sub: (None, None, None, V_MIX_TSP, sub)):
+            rows_CD.append((V_MIX_TSP, dT_CD))
+    for row_AB in rows_AB:
+        for row_CD in rows_CD:
+            yield row_AB + row_CD
+
+ENGINES = {"loop": loop_search, "numpy": numpy_search, "pruned": pruned_search}
+
+# printed hysteresis of a candidate
+def render(candidate):
+    A_UP, B_LOW, dT_AB, V_MIX_TSP, dT_CD = candidate
+    A = h_format % (A_UP-dT_AB, B_LOW)
+    B = h_format % (B_LOW+dT_AB, A_UP)
+    C = h_format % (Tmin_SFC, V_MIX_TSP-dT_CD)
+    D = h_format % (Tmax_SFC, V_MIX_TSP+dT_CD)
+    return (A, B, C, D)
+
+# printed A_UP of a printed hysteresis, B being printed as "B_LOW+dT_AB-A_UP"
+def printed_A_UP(hysteresis):
+    return hysteresis[1].rpartition("-")[2]
+
+# yields the first candidate for each printed hysteresis, with its printed hysteresis
+# (rows found by a worker already carry it). the hysteresis (A, B, C, D) determines the candidate, so different
+# candidates can only print the same when printing is coarser than step: the printed hystereses are only compared then.
+# two such candidates also print the same A_UP, and candidates come in loop order (A_UP ascending), so `rendered` only
+# holds the printed hystereses of the current printed A_UP: memory is bounded by the solutions of one printed A_UP
+def first_seen(candidates, rendered):
+    A_UP = printed_A_UP(next(iter(rendered))) if rendered else None
+    for candidate in candidates:
+        hysteresis = candidate[5:] or render(candidate)
+        if LOSSY:
+            if printed_A_UP(hysteresis) != A_UP:
+                rendered.clear()
+                A_UP = printed_A_UP(hysteresis)
+            elif hysteresis in rendered:
+                continue
+            rendered.add(hysteresis)
+        yield candidate[:5] + hysteresis
+
+# keeps the first candidate for each hysteresis
+def collect(candidates):
+    return list(first_seen(candidates, set()))
+
+# MULTI-PROCESS SEARCH
+# splits the outer ranges into at least `count` shards of one A_UP and a block of B_LOWs, in loop order
+def split(count):
+    blocks = min(len(B_LOWs), -(-count // len(A_UPs)))
+    size = -(-len(B_LOWs) // blocks)
+    return [([A_UP], B_LOWs[i:i+size]) for A_UP in A_UPs for i in range(0, len(B_LOWs), size)]
+
+# runs in a worker process: searches one shard, with its own dedupe.
+# the worker is first set to the step and constants of the parent (see settings): a spawned worker
+# (the start method on Windows) imports this module again, with the default ones
+def search_shard(engine, config, shard):
+    start = time.perf_counter()
+    configure(**config)
+    solutions = collect(ENGINES[engine](*shard))
+    return solutions, time.perf_counter() - start
+
+# yields the solutions of each shard in shard order (i.e. loop order), reporting progress as they come.
+# shards are submitted at most 2*workers ahead of the one consumed and dropped once consumed, so only the solutions
+# of those shards are held. on exit (also on an interrupt or when the caller stops early) the queued shards are cancelled
+def sharded_search(engine, workers, shards):
+    executor = ProcessPoolExecutor(workers)
+    config = settings()
+    futures = collections.deque()
+    try:
+        for i, (A_UP, B_LOW) in enumerate(shards):
+            for shard in shards[i + len(futures):i + 2 * workers]:
+                futures.append(executor.submit(search_shard, engine, config, shard))
+            solutions, elapsed = futures.popleft().result()
+            print("shard %d/%d (A_UP=%s, B_LOW=%s..%s): %d solutions in %.2fs" % (i+1, len(shards), A_UP[0], B_LOW[0], B_LOW[-1], len(solutions), elapsed))
+            yield solutions
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+# global first-seen-wins dedupe of the shard solutions: same rows, same order as a single-process run
+def merge(shard_solutions):
+    solutions = []
+    rendered = set()
+    for shard in shard_solutions:
+        solutions.extend(first_seen(shard, rendered))
+    return solutions
+
+# STREAMING
+# writes the solutions shard by shard while they are found, through a buffered file.
+# after each shard the file is flushed and "<filename>.resume" records how far the search got,
+# so an interrupted run leaves a valid partial csv that --resume completes.
+# the marker also records the shard layout, which --resume keeps whatever the number of workers
+def stream(engine, filename, workers, resume):
+    marker = filename + ".resume"
+    layout = 4 * workers if workers > 1 else 1
+    done, count, offset = 0, 0, None
+    if resume and os.path.exists(marker):
+        with open(marker) as f:
+            state = json.load(f)
+        if state["step"] != step:
+            raise ValueError("%s was written by a different search (step %s)" % (marker, state["step"]))
+        layout, done, count, offset = state["layout"], state["shard"], state["solutions"], state["offset"]
+    shards = split(layout)
+
+    # printed hystereses of the current printed A_UP, compared only when printing can merge different candidates (see first_seen)
+    rendered = set()
+    if offset is not None:
+        with open(filename, mode='r+', newline='') as csv_file:
+            csv_file.truncate(offset) # drops the rows of the interrupted shard
+        if LOSSY:
+            with open(filename, newline='') as csv_file:
+                rows = csv.reader(csv_file, delimiter=';')
+                next(rows) # header
+                for _ in first_seen(map(tuple, rows), rendered):
+                    pass
+
+    if workers > 1:
+        shard_candidates = sharded_search(engine, workers, shards[done:])
+    else:
+        shard_candidates = (ENGINES[engine](*shard) for shard in shards[done:])
+
+    with open(filename, mode='a' if offset is not None else 'w', newline='', buffering=2**20) as csv_file:
+        writer = csv.writer(csv_file, delimiter=';')
+        if offset is None:
+            writer.writerow(HEADER)
+        for i, candidates in enumerate(shard_candidates, done):
+            for solution in first_seen(candidates, rendered):
+                writer.writerow(solution)
+                count += 1
+            csv_file.flush()
+            with open(marker, mode='w') as f:
+                json.dump({"step": step, "layout": layout, "shard": i+1, "solutions": count, "offset": csv_file.tell()}, f)
+    os.remove(marker)
+    return count
+
+# PARAMETER SWEEP
+# constants that a sweep can vary, in the order of the cache key and of the summary table
+PARAMETERS = ["Tmin_SFC", "Tmax_SFC", "dt_HX", "max_A_UP", "min_B_LOW", "min_HYS"]
+
+# whether a search() is running: it holds its constants in the module globals until it is finished or closed
+SEARCHING = False
+
+# sets the given constants (and step) and rebuilds the search ranges and formats that depend on them
+def configure(**parameters):
+    global A_UPs, B_LOWs, dT_ABs, V_MIX_TSPs, dT_CDs, n_format, h_format, LOSSY
+    if SEARCHING:
+        raise RuntimeError("configure() while a search() is running, finish or close it first")
+    unknown = set(parameters) - set(["step"] + PARAMETERS)
+    if unknown:
+        raise ValueError("unknown parameters: %s" % ", ".join(sorted(unknown)))
+    globals().update(parameters)
+    n_format, h_format, LOSSY = formats(step)
+    A_UPs = init(Tmin_SFC, max_A_UP, step)
+    B_LOWs = init(min_B_LOW, Tmax_SFC, step)
+    dT_ABs = init(0, Tmax_SFC, step)
+    V_MIX_TSPs = init(Tmin_SFC, Tmax_SFC, step)
+    dT_CDs = init(0, Tmax_SFC, step)
+
+# the current step and constants, as configure takes them
+def settings():
+    return {name: globals()[name] for name in ["step"] + PARAMETERS}
+
+# cached solution set of a parameter point
+def cache_file(cache, point):
+    name = "_".join("%s=%s" % item for item in zip(["step"] + PARAMETERS, (canonical(step),) + point))
+    return os.path.join(cache, name + ".csv")
+
+# runs in a worker process: searches the step and constants of config (see settings) and caches the solutions in filename.
+# the file is written under a temporary name first, so an interrupted sweep never leaves a partial cache entry
+def sweep_point(engine, config, filename):
+    start = time.perf_counter()
+    configure(**config)
+    solutions = collect(ENGINES[engine]())
+    with open(filename + ".tmp", mode='w', newline='') as csv_file:
+        writer = csv.writer(csv_file, delimiter=';')
+        writer.writerow(HEADER)
+        writer.writerows(solutions)
+    os.replace(filename + ".tmp", filename)
+    return len(solutions), time.perf_counter() - start
+
+# searches every combination of the given parameter values (the other parameters keep their current value)
+# and returns the summary table: one row per combination with its solution count.
+# combinations already in the cache are not searched again
+def sweep(engine="pruned", workers=1, cache="sweep", **ranges):
+    defaults = tuple(globals()[parameter] for parameter in PARAMETERS)
+    values = [ranges.pop(parameter, [default]) for parameter, default in zip(PARAMETERS, defaults)]
+    if ranges:
+        raise ValueError("unknown parameters: %s" % ", ".join(sorted(ranges)))
+    # the points are searched and cached with canonical values, each point once
+    values = [list(dict.fromkeys(canonical(value) for value in parameter_values)) for parameter_values in values]
+    points = list(itertools.product(*values))
+    os.makedirs(cache, exist_ok=True)
+
+    counts = {}
+    for point in points:
+        if os.path.exists(cache_file(cache, point)):
+            with open(cache_file(cache, point), newline='') as csv_file:
+                counts[point] = sum(1 for _ in csv_file) - 1
+    missing = [point for point in points if point not in counts]
+    print("%d combinations, %d cached" % (len(points), len(points) - len(missing)))
+    # the step goes with every point: a spawned worker imports this module again, with the default one
+    configs = [dict(zip(["step"] + PARAMETERS, (step,) + point)) for point in missing]
+    filenames = [cache_file(cache, point) for point in missing]
+
+    try:
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                results = executor.map(sweep_point, [engine] * len(missing), configs, filenames)
+                for i, (point, (count, elapsed)) in enumerate(zip(missing, results)):
+                    print("point %d/%d %s: %d solutions in %.2fs" % (i+1, len(missing), point, count, elapsed))
+                    counts[point] = count
+        else:
+            for i, (point, config, filename) in enumerate(zip(missing, configs, filenames)):
+                count, elapsed = sweep_point(engine, config, filename)
+                print("point %d/%d %s: %d solutions in %.2fs" % (i+1, len(missing), point, count, elapsed))
+                counts[point] = count
+    finally:
+        configure(**dict(zip(PARAMETERS, defaults)))
+    return [point + (step, counts[point]) for point in points]
+
+# SEARCH API
+# lazily yields the solutions (candidate + printed hysteresis) of a design point in loop order.
+# params maps some of PARAMETERS to their value, the others keep their current value. the constants are set
+# for the duration of the search and restored afterwards (also when the caller stops early or closes the generator).
+# searches cannot be interleaved: until the search is finished or closed, starting another one or calling configure
+# raises RuntimeError
+def search(params=None, step=None, engine="pruned"):
+    global SEARCHING
+    if SEARCHING:
+        raise RuntimeError("search() while another search() is running, finish or close it first")
+    point = dict(params or {})
+    if step is not None:
+        point["step"] = step
+    saved = settings()
+    configure(**point)
+    SEARCHING = True
+    try:
+        yield from first_seen(ENGINES[engine](), set())
+    finally:
+        SEARCHING = False
+        configure(**saved)
+
+# parses "name=min:max:step" (or "name=value") into the parameter name and its values
+def sweep_range(text):
+    name, _, values = text.partition("=")
+    if name not in PARAMETERS:
+        raise argparse.ArgumentTypeError("unknown parameter %s, choose from %s" % (name, ", ".join(PARAMETERS)))
+    try:
+        bounds = [number(value) for value in values.split(":")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected %s=min:max:step or %s=value, got %s" % (name, name, text))
+    return name, init(*bounds) if len(bounds) == 3 else bounds
+
+# CLI: thin wrapper around search, stream and sweep
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search of the hysteresis temperatures satisfying C0..C8")
+    parser.add_argument("name", nargs="?", default="data", help="name of the output csv file (without extension)")
+    parser.add_argument("--step", type=number, help="temperature search step (default %s)" % step)
+    parser.add_argument("--engine", choices=ENGINES, default="pruned", help="search engine, all engines give the same solutions")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes sharing the search")
+    parser.add_argument("--stream", action="store_true", help="write the solutions as they are found, with bounded memory")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted --stream run")
+    parser.add_argument("--sweep", type=sweep_range, nargs="+", metavar="NAME=MIN:MAX:STEP",
+                        help="search every combination of the given constants (%s), name is then the summary table" % ", ".join(PARAMETERS))
+    parser.add_argument("--cache", default="sweep", help="directory of the cached solution sets of --sweep")
+    args = parser.parse_args(argv)
+    if args.step is not None:
+        configure(step=args.step)
+    filename = args.name + '.csv'
+
+    if args.sweep:
+        summary = sweep(args.engine, args.workers, args.cache, **dict(args.sweep))
+        with open(filename, mode='w', newline='') as csv_file:
+            writer = csv.writer(csv_file, delimiter=';')
+            writer.writerow(PARAMETERS + ["step", "solutions"])
+            writer.writerows(summary)
+        count = sum(row[-1] for row in summary)
+    elif args.stream or args.resume:
+        try:
+            count = stream(args.engine, filename, args.workers, args.resume)
+        except KeyboardInterrupt:
+            print("interrupted: %s holds the solutions found so far, continue with --resume" % filename)
+            raise SystemExit(1)
+    else:
+        if args.workers > 1:
+            solutions = merge(sharded_search(args.engine, args.workers, split(4 * args.workers)))
+        else:
+            solutions = list(search(engine=args.engine))
+
+        # FILE CREATION
+        with open(filename, mode='w', newline='') as csv_file:
+            writer = csv.writer(csv_file, delimiter=';')
+            writer.writerow(HEADER)
+            writer.writerows(solutions)
+        count = len(solutions)
+    print("solution count: ", count)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 #include "pch.h"
 #include <fstream>
+#include <cmath>
+#include <map>
 #include <string>
 #ifdef _DEBUG
 #undef _DEBUG
@@ -8,6 +10,7 @@
 #else
 #include <Python.h>
 #endif
+#include <structmember.h>
 #include "TRNSYS.h" //TRNSYS access functions (allow to acess TIME etc.) 
 
 //---------------------------------------------------------------------------------------------------------------------- -
@@ -24,6 +27,78 @@
 // Wrapper functions for TRNSYS APIs
 //************************************************************************
 
+// Read-only context of a unit for Python (getContext), built once at its start time: the simulation times, the unit
+// and its parameters, and flags telling the kind of the call in progress
+typedef struct
+{
+	PyObject_HEAD
+	int unit, type;
+	double timestep, start, stop;
+	PyObject *parameters;
+	char firstCall, endOfTimestep, lastCall;
+} ContextObject;
+
+static PyMemberDef ContextMembers[] =
+{
+	{ (char*)"unit", T_INT, offsetof(ContextObject, unit), READONLY, (char*)"Number of the Unit." },
+	{ (char*)"type", T_INT, offsetof(ContextObject, type), READONLY, (char*)"Number of the Type." },
+	{ (char*)"timestep", T_DOUBLE, offsetof(ContextObject, timestep), READONLY, (char*)"Time step of the simulation." },
+	{ (char*)"start", T_DOUBLE, offsetof(ContextObject, start), READONLY, (char*)"Start time of the simulation." },
+	{ (char*)"stop", T_DOUBLE, offsetof(ContextObject, stop), READONLY, (char*)"Stop time of the simulation." },
+	{ (char*)"parameters", T_OBJECT, offsetof(ContextObject, parameters), READONLY, (char*)"Values of the parameters of the Unit, as a tuple." },
+	{ (char*)"first_call", T_BOOL, offsetof(ContextObject, firstCall), READONLY, (char*)"True during the first call of the function of the Unit." },
+	{ (char*)"end_of_timestep", T_BOOL, offsetof(ContextObject, endOfTimestep), READONLY, (char*)"True during the call at the end of a time step (END_CALLS)." },
+	{ (char*)"last_call", T_BOOL, offsetof(ContextObject, lastCall), READONLY, (char*)"True during the call at the end of the simulation (END_CALLS)." },
+	{ NULL }
+};
+
+static void Context_dealloc(ContextObject *self)
+{
+	Py_XDECREF(self->parameters);
+	Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+// No tp_new: the contexts are only created by the bridge
+static PyTypeObject ContextType = { PyVarObject_HEAD_INIT(NULL, 0) };
+
+// State of one unit of this Type. Every unit of the deck has its own, so that several units can run their own
+// controllers in one simulation (see the registry below)
+struct UnitState
+{
+	// The script, its function and the object the function is called with (NULL: called without arguments)
+	std::string scriptName, functionName;
+	PyObject *pModule = NULL, *pFunc = NULL, *pState = NULL;
+	ContextObject *context = NULL;
+
+	// The function is also called at the end of each time step and at the last call if the script sets END_CALLS
+	bool endCalls = false;
+	bool started = false, finished = false;
+
+	// Input and output arrays of the unit, allocated at the start time. Once Python holds a view of one of them
+	// (getInputBuffer, getOutputBuffer), the inputs are copied into it before each call of the Python function
+	// and the outputs are sent back to TRNSYS from it after the call
+	double *inputBuffer = NULL, *outputBuffer = NULL;
+	int inputCount = 0, outputCount = 0;
+	bool inputsShared = false, outputsShared = false;
+
+	// Skipping of the redundant calls (parameter 3, the input tolerance; negative: the Python function is called at every
+	// iteration): the inputs and time of the last call, and the outputs last set by Python, re-sent when a call is skipped
+	double *lastInputs = NULL, *outputCache = NULL;
+	double lastTime = 0.0;
+	bool called = false;
+};
+
+// Registry of the units by unit number, and the unit being called (the one the wrapper functions act on)
+static std::map<int, UnitState> units;
+static UnitState *current = NULL;
+
+// Keep the value of output outNum for the skipped calls
+static void cacheOutput(int outNum, double outVal)
+{
+	if (current != NULL && current->outputCache != NULL && outNum >= 1 && outNum <= current->outputCount)
+		current->outputCache[outNum - 1] = outVal;
+}
+
 // A double precision function that returns the value of the parameter parNum.
 static PyObject* TRNSYS_getParameterValue(PyObject *self, PyObject *args)
 {
@@ -55,6 +130,7 @@ static PyObject* TRNSYS_setOutputValue(PyObject *self, PyObject *args)
 		return NULL;
 
 	setOutputValue(&outNum, &outVal);
+	cacheOutput(outNum, outVal);
 	// return 
 	Py_INCREF(Py_None);
 	return Py_None;
@@ -65,12 +141,129 @@ static PyObject* TRNSYS_getTimeStep(PyObject* self, PyObject* args)
 	return PyFloat_FromDouble(getSimulationTime());
 }
 
+// A function that returns the number of the unit calling Python.
+static PyObject* TRNSYS_getCurrentUnit(PyObject* self, PyObject* args)
+{
+	return PyLong_FromLong(getCurrentUnit());
+}
+
+// A function that returns the read-only context of the unit calling Python (the same object at every call).
+static PyObject* TRNSYS_getContext(PyObject* self, PyObject* args)
+{
+	if (current == NULL || current->context == NULL)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "The context is built at the start time of the simulation");
+		return NULL;
+	}
+	Py_INCREF(current->context);
+	return (PyObject*)current->context;
+}
+
+// A memoryview of the count doubles at data, without copy (flags: PyBUF_READ or PyBUF_WRITE).
+static PyObject* doubleView(double *data, int count, int flags)
+{
+	PyObject *bytes = PyMemoryView_FromMemory((char*)data, (Py_ssize_t)count * sizeof(double), flags);
+	if (bytes == NULL)
+		return NULL;
+	PyObject *view = PyObject_CallMethod(bytes, "cast", "s", "d");
+	Py_DECREF(bytes);
+	return view;
+}
+
+// A function that returns a read-only view of the input array of the unit, holding the current inputs at each call.
+static PyObject* TRNSYS_getInputBuffer(PyObject* self, PyObject* args)
+{
+	if (current == NULL || current->inputBuffer == NULL)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "The input array is allocated at the start time of the simulation");
+		return NULL;
+	}
+	current->inputsShared = true;
+	return doubleView(current->inputBuffer, current->inputCount, PyBUF_READ);
+}
+
+// A function that returns a writable view of the output array of the unit, sent back to TRNSYS after each call.
+static PyObject* TRNSYS_getOutputBuffer(PyObject* self, PyObject* args)
+{
+	if (current == NULL || current->outputBuffer == NULL)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "The output array is allocated at the start time of the simulation");
+		return NULL;
+	}
+	current->outputsShared = true;
+	return doubleView(current->outputBuffer, current->outputCount, PyBUF_WRITE);
+}
+
+// A function that returns the current values of all the inputs of the unit as a tuple, in one call.
+static PyObject* TRNSYS_getInputValues(PyObject* self, PyObject* args)
+{
+	int index = 1;
+	int ni = (int)(getParameterValue(&index) + 0.1);
+	PyObject *inputs = PyTuple_New(ni);
+	if (inputs == NULL)
+		return NULL;
+	for (int i = 1; i <= ni; i++)
+	{
+		PyObject *inpVal = PyFloat_FromDouble(getInputValue(&i));
+		if (inpVal == NULL)
+		{
+			Py_DECREF(inputs);
+			return NULL;
+		}
+		PyTuple_SET_ITEM(inputs, i - 1, inpVal);
+	}
+	return inputs;
+}
+
+// A function to set the outputs 1, 2, ... in TRNSYS from a sequence of values, in one call.
+static PyObject* TRNSYS_setOutputValues(PyObject* self, PyObject* args)
+{
+	PyObject *values, *outputs;
+	if (!PyArg_ParseTuple(args, "O", &values))
+		return NULL;
+	outputs = PySequence_Fast(values, "setOutputValues expects a sequence of output values");
+	if (outputs == NULL)
+		return NULL;
+
+	int index = 2;
+	int no = (int)(getParameterValue(&index) + 0.1);
+	Py_ssize_t count = PySequence_Fast_GET_SIZE(outputs);
+	if (count > no)
+	{
+		Py_DECREF(outputs);
+		PyErr_Format(PyExc_ValueError, "%zd output values for %d outputs", count, no);
+		return NULL;
+	}
+	PyObject **items = PySequence_Fast_ITEMS(outputs);
+	for (int i = 1; i <= (int)count; i++)
+	{
+		double outVal = PyFloat_AsDouble(items[i - 1]);
+		if (outVal == -1.0 && PyErr_Occurred())
+		{
+			Py_DECREF(outputs);
+			return NULL;
+		}
+		setOutputValue(&i, &outVal);
+		cacheOutput(i, outVal);
+	}
+	Py_DECREF(outputs);
+	// return 
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
 static PyMethodDef EmbMethods[] = 
 {
 	{ "getParameterValue", TRNSYS_getParameterValue, METH_VARARGS, "A double precision function that returns the value of the current Unitfs ith parameter." },
 	{ "getInputValue", TRNSYS_getInputValue, METH_VARARGS, "A double precision function that returns the current value of the current Typefs ith input." },
 	{ "setOutputValue", TRNSYS_setOutputValue, METH_VARARGS, "Send the value back to the TRNSYS kernel for global storage." },
 	{ "getSimulationTime", TRNSYS_getTimeStep, METH_VARARGS, "Get simulation time" },
+	{ "getCurrentUnit", TRNSYS_getCurrentUnit, METH_VARARGS, "Returns the number of the Unit calling the Python script." },
+	{ "getContext", TRNSYS_getContext, METH_VARARGS, "Returns the read-only context of the current Unit: times of the simulation, Unit, Type, parameters and kind of call." },
+	{ "getInputValues", TRNSYS_getInputValues, METH_VARARGS, "Returns the current values of all the inputs of the current Unit as a tuple." },
+	{ "setOutputValues", TRNSYS_setOutputValues, METH_VARARGS, "Send the values of the outputs 1, 2, ... back to the TRNSYS kernel in one call." },
+	{ "getInputBuffer", TRNSYS_getInputBuffer, METH_VARARGS, "Returns a read-only memoryview of doubles over the inputs of the current Unit, updated before each call." },
+	{ "getOutputBuffer", TRNSYS_getOutputBuffer, METH_VARARGS, "Returns a writable memoryview of doubles over the outputs of the current Unit, sent to TRNSYS after each call." },
 	{ NULL, NULL, 0, NULL }
 };
 
@@ -82,9 +275,110 @@ static PyModuleDef EmbModule =
 
 static PyObject* PyInit_emb(void)
 {
+	ContextType.tp_name = "TRNSYSpy.Context";
+	ContextType.tp_doc = "Read-only context of a Unit of Type169";
+	ContextType.tp_basicsize = sizeof(ContextObject);
+	ContextType.tp_flags = Py_TPFLAGS_DEFAULT;
+	ContextType.tp_dealloc = (destructor)Context_dealloc;
+	ContextType.tp_members = ContextMembers;
+	if (PyType_Ready(&ContextType) < 0)
+		return NULL;
 	return PyModule_Create(&EmbModule);
 }
 
+// Builds the context of the current unit (np parameters)
+static ContextObject* newContext(int CurrentUnit, int CurrentType, double Timestep, int np)
+{
+	ContextObject *context = PyObject_New(ContextObject, &ContextType);
+	if (context == NULL)
+		return NULL;
+	context->unit = CurrentUnit;
+	context->type = CurrentType;
+	context->timestep = Timestep;
+	context->start = getSimulationStartTime();
+	context->stop = getSimulationStopTime();
+	context->firstCall = context->endOfTimestep = context->lastCall = 0;
+	context->parameters = PyTuple_New(np);
+	if (context->parameters == NULL)
+	{
+		Py_DECREF(context);
+		return NULL;
+	}
+	for (int index = 1; index <= np; index++)
+	{
+		PyObject *parVal = PyFloat_FromDouble(getParameterValue(&index));
+		if (parVal == NULL)
+		{
+			Py_DECREF(context);
+			return NULL;
+		}
+		PyTuple_SET_ITEM(context->parameters, index - 1, parVal);
+	}
+	return context;
+}
+
+// Calls the function of the unit (with its state if createUnit gave one): the shared input array filled before, the
+// shared output array sent back to TRNSYS after. Returns false, the error reported to TRNSYS, if the call failed
+static bool callFunction(UnitState &unit, int CurrentUnit, int CurrentType)
+{
+	int i, errorCode;
+	char type[20];
+	char message[400];
+	std::string errorMessage;
+	PyObject *pValue;
+
+	//The script of the unit failed to load at the start time (reported then)
+	if (unit.pFunc == NULL || unit.context == NULL)
+		return false;
+	unit.context->firstCall = !unit.started;
+	unit.started = true;
+	// Calling the function in the Python script - the Python script should get the inputs and parameters and assign the outputs directly using the Python extension functions created earlier
+	try
+	{
+		//Copy the inputs into the shared input array
+		if (unit.inputsShared)
+		{
+			for (i = 1; i <= unit.inputCount; i++)
+				unit.inputBuffer[i - 1] = getInputValue(&i);
+		}
+		if (unit.pState != NULL)
+			pValue = PyObject_CallFunctionObjArgs(unit.pFunc, unit.pState, NULL);
+		else
+			pValue = PyObject_CallObject(unit.pFunc, NULL);
+		if (pValue != NULL) 
+		{
+			//Function called successfully
+			Py_DECREF(pValue);
+			//Send the shared output array back to TRNSYS
+			if (unit.outputsShared)
+			{
+				for (i = 1; i <= unit.outputCount; i++)
+				{
+					setOutputValue(&i, &unit.outputBuffer[i - 1]);
+					cacheOutput(i, unit.outputBuffer[i - 1]);
+				}
+			}
+			return true;
+		}
+		else
+		{
+			// Failed to calling the function
+			PyErr_PrintEx(0);
+		}
+	}
+	catch (...)
+	{
+		//An exception happened try to exit gracefully
+		PyErr_PrintEx(0);
+	}
+	errorCode = -1;
+	strcpy_s(type, "Fatal");
+	errorMessage = "Failed to call the function, " + unit.functionName + ", from the Python script file: " + unit.scriptName;
+	strcpy_s(message, errorMessage.c_str());
+	messages(&errorCode, message, type, &CurrentUnit, &CurrentType, (size_t)strlen(message), (size_t)strlen(type));
+	return false;
+}
+
 
 // A C++ routine for trimming the specified string
 std::string trim(const std::string& str)
@@ -105,9 +399,9 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 	int i, CurrentUnit, CurrentType, np, ni, no, index, errorCode;
 	char type[20];
 	char message[400];
-	static std::string scriptName, RootDir, InputDir, scriptPath, functionName;
+	std::string scriptName, RootDir, InputDir, scriptPath, functionName;
 	std::string errorMessage;
-	static PyObject *pName, *pModule, *pFunc, *pValue;
+	PyObject *pName;
 
 	//Get the Global Trnsys Simulation Variables
 	Time = getSimulationTime();
@@ -126,12 +420,56 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 	//Do All of the Last Call Manipulations Here
 	if (getIsLastCallofSimulation())
 	{
+		//The last call of the function of this unit if the script asks for it
+		auto found = units.find(CurrentUnit);
+		if (found != units.end())
+		{
+			UnitState &unit = found->second;
+			current = &unit;
+			unit.finished = true;
+			if (unit.endCalls && unit.context != NULL)
+			{
+				unit.context->lastCall = 1;
+				callFunction(unit, CurrentUnit, CurrentType);
+				unit.context->lastCall = 0;
+			}
+		}
+		for (auto &entry : units)
+		{
+			if (!entry.second.finished)
+				return;
+		}
+		//Finalize the interpreter once, at the last call of the last unit, so that the atexit handlers of the scripts run
+		//(e.g. the buffered output files are written)
+		if (Py_IsInitialized())
+			Py_FinalizeEx();
+		//The views of the shared arrays and the Python objects of the units are gone with the interpreter
+		for (auto &entry : units)
+		{
+			delete[] entry.second.inputBuffer;
+			delete[] entry.second.outputBuffer;
+			delete[] entry.second.lastInputs;
+			delete[] entry.second.outputCache;
+		}
+		units.clear();
+		current = NULL;
 		return;
 	}
 
+	//The state of this unit, created at its first call
+	UnitState &unit = units[CurrentUnit];
+	current = &unit;
+
 	//Perform Any "End of Timestep" Manipulations That May Be Required
 	if (getIsEndOfTimestep()) 
 	{
+		//Call the function with the converged values of the time step if the script asks for it
+		if (unit.endCalls && unit.context != NULL)
+		{
+			unit.context->endOfTimestep = 1;
+			callFunction(unit, CurrentUnit, CurrentType);
+			unit.context->endOfTimestep = 0;
+		}
 		return;
 	}
 
@@ -139,7 +477,7 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 	if (getIsFirstCallofSimulation())
 	{
 		//Tell the TRNSYS Engine How This Type Works
-		np = 2;
+		np = 3;
 		setNumberofParameters(&np);
 		index = 1;
 		ni = (int)(getParameterValue(&index) + 0.1);
@@ -271,20 +609,46 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 		int dot = (int)scriptName.rfind(".");
 		if (dot >= 0) scriptName.erase(dot, scriptName.length() - 1);
 
-		// Import TRNSYS module into the Python environment
-		PyImport_AppendInittab("TRNSYSpy", &PyInit_emb);
+		//Allocate the input and output arrays shared with Python (zero-filled)
+		unit.inputCount = ni;
+		unit.outputCount = no;
+		unit.inputBuffer = new double[ni > 0 ? ni : 1]();
+		unit.outputBuffer = new double[no > 0 ? no : 1]();
+		unit.lastInputs = new double[ni > 0 ? ni : 1]();
+		unit.outputCache = new double[no > 0 ? no : 1]();
+		unit.scriptName = scriptName;
+		unit.functionName = functionName;
+
+		//Start the interpreter once, for all the units
+		if (!Py_IsInitialized())
+		{
+			// Import TRNSYS module into the Python environment
+			PyImport_AppendInittab("TRNSYSpy", &PyInit_emb);
 
-		Py_Initialize();
+			Py_Initialize();
+			PyRun_SimpleString("import sys");
+		}
+		//The context of the unit, readable by the script from its import
+		unit.context = newContext(CurrentUnit, CurrentType, Timestep, 3);
+		if (unit.context == NULL)
+		{
+			PyErr_Print();
+			errorCode = -1;
+			strcpy_s(type, "Fatal");
+			strcpy_s(message, "Failed to build the context of the unit for Python.");
+			messages(&errorCode, message, type, &CurrentUnit, &CurrentType, (size_t)strlen(message), (size_t)strlen(type));
+			return;
+		}
 		// Add the script path
-		PyRun_SimpleString("import sys");
 		PyRun_SimpleString(scriptPath.c_str());
 
 		pName = PyUnicode_DecodeFSDefault(scriptName.c_str());
 
 		/* Error checking of pName left out */
-		pModule = PyImport_Import(pName);
+		//A script used by several units is imported once; its createUnit (below) gives each unit its own state
+		unit.pModule = PyImport_Import(pName);
 
-		if (pModule == NULL)
+		if (unit.pModule == NULL)
 		{
 			PyErr_Print();
 			errorCode = -1;
@@ -294,9 +658,9 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 			return;
 		}
 
-		pFunc = PyObject_GetAttrString(pModule, functionName.c_str());
+		unit.pFunc = PyObject_GetAttrString(unit.pModule, functionName.c_str());
 
-		if (!pFunc || !PyCallable_Check(pFunc))
+		if (!unit.pFunc || !PyCallable_Check(unit.pFunc))
 		{
 			if (PyErr_Occurred()) PyErr_Print();
 			errorCode = -1;
@@ -309,6 +673,32 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 
 		Py_DECREF(pName);
 
+		//Calls at the end of each time step and at the last call, if the script sets END_CALLS to True
+		PyObject *pEndCalls = PyObject_GetAttrString(unit.pModule, "END_CALLS");
+		if (pEndCalls != NULL)
+		{
+			unit.endCalls = PyObject_IsTrue(pEndCalls) == 1;
+			Py_DECREF(pEndCalls);
+		}
+		else
+			PyErr_Clear();
+
+		//Per-unit state: if the script defines createUnit(unit), the function is called with the object it returns for this unit
+		if (PyObject_HasAttrString(unit.pModule, "createUnit"))
+		{
+			unit.pState = PyObject_CallMethod(unit.pModule, "createUnit", "i", CurrentUnit);
+			if (unit.pState == NULL)
+			{
+				PyErr_Print();
+				errorCode = -1;
+				strcpy_s(type, "Fatal");
+				errorMessage = "Failed to create the state of the unit with createUnit from the Python script file: " + scriptName;
+				strcpy_s(message, errorMessage.c_str());
+				messages(&errorCode, message, type, &CurrentUnit, &CurrentType, (size_t)strlen(message), (size_t)strlen(type));
+				return;
+			}
+		}
+
 		errorCode = -1;
 		strcpy_s(type, "Notice");
 		errorMessage = "The function, " + functionName + ", was loaded from the Python script file: " + scriptName;
@@ -325,42 +715,35 @@ extern "C" __declspec(dllexport) void TYPE169(void)
 	ni = (int)(getParameterValue(&index) + 0.1);
 	index = 2;
 	no = (int)(getParameterValue(&index) + 0.1);
+	index = 3;
+	double tolerance = getParameterValue(&index);
 	//---------------------------------------------------------------------------------------------------------------------- -
 
 	//---------------------------------------------------------------------------------------------------------------------- -
-	//Perform All of the Calculations Here
-	// Calling the function in the Python script - the Python script should get the inputs and parameters and assign the outputs directly using the Python extension functions created earlier
-	try
+	//Skip the call on the iterations where the time is the same and no input has changed by more than the tolerance:
+	//the Python function would only recompute the same outputs, which are sent again from the cache
+	if (tolerance >= 0.0)
 	{
-		pValue = PyObject_CallObject(pFunc, NULL);
-		if (pValue != NULL) 
+		bool changed = !unit.called || Time != unit.lastTime;
+		for (i = 1; i <= ni && !changed; i++)
+			changed = fabs(getInputValue(&i) - unit.lastInputs[i - 1]) > tolerance;
+		if (!changed)
 		{
-			//Function called successfully
-			Py_DECREF(pValue);
-		}
-		else
-		{
-			// Failed to calling the function
-			PyErr_PrintEx(0);
-			errorCode = -1;
-			strcpy_s(type, "Fatal");
-			errorMessage = "Failed to call the function, " + functionName + ", from the Python script file: " + scriptName;
-			strcpy_s(message, errorMessage.c_str());
-			messages(&errorCode, message, type, &CurrentUnit, &CurrentType, (size_t)strlen(message), (size_t)strlen(type));
+			for (i = 1; i <= no; i++)
+				setOutputValue(&i, &unit.outputCache[i - 1]);
 			return;
 		}
+		for (i = 1; i <= ni; i++)
+			unit.lastInputs[i - 1] = getInputValue(&i);
+		unit.lastTime = Time;
+		unit.called = true;
 	}
-	catch (...)
-	{
-		//An exception happened try to exit gracefully
-		PyErr_PrintEx(0);
-		errorCode = -1;
-		strcpy_s(type, "Fatal");
-		errorMessage = "Failed to call the function, " + functionName + ", from the Python script file: " + scriptName;
-		strcpy_s(message, errorMessage.c_str());
-		messages(&errorCode, message, type, &CurrentUnit, &CurrentType, (size_t)strlen(message), (size_t)strlen(type));
+	//---------------------------------------------------------------------------------------------------------------------- -
+
+	//---------------------------------------------------------------------------------------------------------------------- -
+	//Perform All of the Calculations Here
+	if (!callFunction(unit, CurrentUnit, CurrentType))
 		return;
-	}
 
 //---------------------------------------------------------------------------------------------------------------------- -
 
@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import subprocess
+import platform
+import argparse
+import resource
+import hashlib
+import json
+import time
+import os
+import Permutation
+
+# BENCHMARK SETTINGS
+STEPS = [1, 0.5, 0.2, 0.1]
+# largest grid (number of candidates) each engine is run on, None for no limit.
+# the loop engine evaluates a few 10^5 candidates per second, so larger grids would take hours.
+# the numpy engine skips the chunks with an empty partial mask (see Permutation.combine) and the pruned engine only
+# enumerates bounded sub-ranges, so both run at every step
+MAX_POINTS = {"loop": 10**7, "numpy": None, "pruned": None}
+
+# number of candidates of the full search grid at the given step
+def grid_size(step):
+    Permutation.configure(step=step)
+    size = 1
+    for values in (Permutation.A_UPs, Permutation.B_LOWs, Permutation.dT_ABs, Permutation.V_MIX_TSPs, Permutation.dT_CDs):
+        size *= len(values)
+    return size
+
+# runs in a fresh process (so that its peak RSS is its own): one full search, counted and hashed without storing the solutions
+def run(step, engine):
+    digest = hashlib.sha256()
+    count = 0
+    start = time.perf_counter()
+    for solution in Permutation.search(step=step, engine=engine):
+        digest.update(repr(solution).encode())
+        count += 1
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on linux
+    return {"solutions": count, "digest": digest.hexdigest(), "wall_time": elapsed, "peak_rss_mb": peak_rss}
+
+# commit of the benchmarked Permutation.py, whatever the working directory
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# runs every engine at every step, each in its own process, and checks that the engines agree at each step
+def benchmark(steps=STEPS, engines=list(Permutation.ENGINES), max_points=MAX_POINTS):
+    runs = []
+    consistent = {}
+    context = multiprocessing.get_context("spawn")
+    for step in steps:
+        size = grid_size(step)
+        digests = set()
+        for engine in engines:
+            result = {"step": step, "engine": engine, "candidates": size}
+            limit = max_points.get(engine)
+            if limit is not None and size > limit:
+                result["skipped"] = "grid of %d candidates above the %d limit of this engine" % (size, limit)
+                print("step %s, %s: skipped (%d candidates)" % (step, engine, size))
+            else:
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    result.update(executor.submit(run, step, engine).result())
+                # full grid over wall time: an equivalent throughput, the numpy and pruned engines evaluate far fewer points
+                result["grid_points_per_second"] = size / result["wall_time"]
+                digests.add(result["digest"])
+                print("step %s, %s: %d solutions in %.2fs (%.3g grid points/s, %.0f MB peak)" % (
+                    step, engine, result["solutions"], result["wall_time"], result["grid_points_per_second"], result["peak_rss_mb"]))
+            runs.append(result)
+        consistent[str(step)] = len(digests) <= 1
+        if not consistent[str(step)]:
+            print("step %s: the engines do not return the same solutions" % step)
+    return {"commit": commit(), "python": platform.python_version(), "numpy": Permutation.np.__version__,
+            "consistent": consistent, "runs": runs}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the Permutation.py engines across step sizes")
+    parser.add_argument("output", nargs="?", default="benchmark.json", help="json file of the results")
+    parser.add_argument("--steps", type=Permutation.number, nargs="+", default=STEPS, help="search steps")
+    parser.add_argument("--engines", choices=Permutation.ENGINES, nargs="+", default=list(Permutation.ENGINES), help="engines to compare")
+    parser.add_argument("--all", action="store_true", help="run every engine at every step, ignoring MAX_POINTS")
+    args = parser.parse_args()
+
+    results = benchmark(args.steps, args.engines, {} if args.all else MAX_POINTS)
+    with open(args.output, mode='w') as f:
+        json.dump(results, f, indent=2)
+    if not all(results["consistent"].values()):
+        raise SystemExit(1)
@@ -0,0 +1,83 @@
+import argparse
+import logsink
+import scenarios
+import replay
+import engine
+import plant
+import shutil
+import os
+
+# Conformance of the engine presets: each preset and its original script (reference/APCS1.py..APCS6.py, kept
+# unchanged: fixes go to engine.py only) are replayed on the same recorded inputs, open loop and closed loop
+# (plant.py), each in its own directory. The outputs set at every timestep and the output files (control.csv,
+# st_on.csv, shift.csv, control-debug.log) must be identical
+FILES = ["control.csv", "st_on.csv", "shift.csv", "control-debug.log"]
+
+# replays the preset like APCS.py (the main() below) would run it under TRNSYS
+def runPreset(preset, trace, directory, iterations=3, closed_loop=False):
+   controller = engine.Engine(preset, directory)
+   trnsys = replay.ReplayTRNSYS()
+   def main():
+      outputs = controller.step(trnsys.getSimulationTime(), [trnsys.getInputValue(i) for i in range(1, controller.inputs + 1)])
+      for i, value in enumerate(outputs, 1):
+         trnsys.setOutputValue(i, value)
+   return replay.drive(main, trnsys, trace, iterations, plant.TESPlant.forEngine(controller) if closed_loop else None)
+
+def runScript(script, trace, directory, iterations=3, closed_loop=False):
+   return replay.replay(script, trace, directory, iterations, model=plant.TESPlant.forController if closed_loop else None)
+
+# first difference between the runs of the script and of the preset, or None
+def compare(script_dir, preset_dir, script_outputs, preset_outputs):
+   for script_row, preset_row in zip(script_outputs, preset_outputs):
+      if script_row != preset_row:
+         return "outputs differ at time %s: %s != %s" % (script_row[0], script_row[1:], preset_row[1:])
+   if len(script_outputs) != len(preset_outputs):
+      return "%d timesteps != %d" % (len(script_outputs), len(preset_outputs))
+   for name in FILES:
+      paths = [os.path.join(script_dir, name), os.path.join(preset_dir, name)]
+      if not any(os.path.exists(path) for path in paths):
+         continue
+      if not all(os.path.exists(path) for path in paths):
+         return "%s written by only one of them" % name
+      with open(paths[0], mode='r') as script_file, open(paths[1], mode='r') as preset_file:
+         script_lines, preset_lines = script_file.readlines(), preset_file.readlines()
+      for number, (script_line, preset_line) in enumerate(zip(script_lines, preset_lines), 1):
+         if script_line != preset_line:
+            return "%s differs at line %d: %r != %r" % (name, number, script_line, preset_line)
+      if len(script_lines) != len(preset_lines):
+         return "%s: %d lines != %d" % (name, len(script_lines), len(preset_lines))
+   return None
+
+# checks the presets against the scripts in scriptdir, with the input files of inputdir; returns {(preset, closed_loop): difference or None}
+def check(trace, presets=engine.SCRIPTED, inputdir=".", scriptdir=".", root="conformance", iterations=3):
+   results = {}
+   for preset in presets:
+      for closed_loop in (False, True):
+         directories = []
+         for kind in ("script", "preset"):
+            directory = os.path.join(root, preset, "closed" if closed_loop else "open", kind)
+            shutil.rmtree(directory, ignore_errors=True)
+            scenarios.prepare({"inputdir": inputdir}, directory)
+            directories.append(directory)
+         script_outputs = runScript(os.path.join(scriptdir, preset + ".py"), trace, directories[0], iterations, closed_loop)
+         preset_outputs = runPreset(preset, trace, directories[1], iterations, closed_loop)
+         # the files are complete before they are compared
+         logsink.closeSinks()
+         del logsink.SINKS[:]
+         results[preset, closed_loop] = compare(directories[0], directories[1], script_outputs, preset_outputs)
+         print("%s %s loop: %s" % (preset, "closed" if closed_loop else "open", results[preset, closed_loop] or "identical"))
+   return results
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Checks that every engine preset reproduces its APCS script step for step")
+   parser.add_argument("trace", help="csv of the recorded inputs (see replay.readTrace)")
+   parser.add_argument("--presets", nargs="+", choices=engine.SCRIPTED, default=engine.SCRIPTED, help="presets to check")
+   parser.add_argument("--inputdir", default=".", help="directory of the controller input files")
+   parser.add_argument("--scriptdir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference"), help="directory of the original APCS1.py..APCS6.py")
+   parser.add_argument("--output", default="conformance", help="directory of the runs")
+   parser.add_argument("--iterations", type=int, default=3, help="calls per timestep (TRNSYS iterations)")
+   args = parser.parse_args()
+
+   results = check(replay.readTrace(args.trace), args.presets, args.inputdir, args.scriptdir, args.output, args.iterations)
+   if any(results.values()):
+      raise SystemExit(1)
@@ -0,0 +1,554 @@
+from time import perf_counter
+import operator
+import math
+import os
+from timeseries import loadSeries, lowestMask
+from logsink import openSink, openTrace
+
+# Single implementation of the APCS controllers: the variants APCS1..APCS6 differ only in the strategies
+# below, selected by name in PRESETS. Engine(preset) behaves step for step like the matching original script
+# (reference/APCS1.py..APCS6.py, see conformance.py); APCS.py runs it under TRNSYS, and APCS1.py..APCS6.py
+# run APCS.py with their preset.
+
+# files, relative to the directory of the engine
+PV_PATH = "PV_PRO.csv"
+DEMAND_PATH = "BUI_LOAD_norm.csv"
+DEMAND_DAY_PATH = "BUI_LOAD_day.csv"
+EL_DEC_PATH = "EL_DEC.csv"
+PRICE_PATH = "PRICE.csv"
+
+# TIME
+STEP = 6/60
+
+# CONSTANTS
+TES_OFF_MODE = 0
+TES_HEAT_MODE = HEAT_SEASON = 1
+TES_COOL_MODE = COOL_SEASON = -1
+TES_HEAT_OFF = 0 # control signal of TES charging in heating mode
+TES_PUMP_ON = 1
+TES_PUMP_OFF = 0
+
+# PARAMS (to be decided by user): defaults of every preset, see PRESETS for the values of each variant
+PARAMETERS = {
+   "PV_SPAN": 4.0, # time period that in each PV production is evaluated (window "span")
+   "PV_SPAN_MIN": 0.5, # shortest overproduction run to charge in (window "runs")
+   "DECISION_HOUR": 0, # time of the day when decision of TES charging is taken
+   "PREDICTION_HORIZON": 24,
+   "MIN_PV": 12600, # threshold of PV production which is equal to minimum power rate of heatpumps
+   "MAX_SOC": 0.95, # fully charged value of TES SOC in heating mode
+   "MIN_SOC": 0.05, # fully charged value of TES SOC in cooling mode
+   "SOC_DISCHARGED_HEAT": 0.05, # threshold of fully discharged TES in heating mode
+   "SOC_DISCHARGED_COOL": 0.95, # threshold of fully discharged TES in cooling mode
+   "MAX_Q_TES": 161.08,
+   "MIN_Q_TES": 20.94,
+   "SIMUL_END": 9504.0,
+   "TES_CHARGING_TIME_HEAT": 4, # hours of cheapest prices to charge in (shift "prices")
+   "TES_CHARGING_TIME_COOL": 5,
+   "CHARGE_RATE": 37.8, # kW of heat into the TES when charging, MIN_PV times the COP of the heat pumps (shift "optimal")
+   "MIN_CHARGE_RUN": 0.5, # hours, shortest charging run once the heat pumps are started (shift "optimal")
+}
+
+# STRATEGIES
+# time step key (tenths of hour) of a time
+KEYS = {
+   "truncate": lambda timestep: int(float(timestep)*10),
+   "round": lambda timestep: int(round(float(timestep)*10,1)),
+}
+
+# season of the day
+SEASONS = {
+   "norm": lambda c: HEAT_SEASON if c.demand_norm >= 0.5 else COOL_SEASON, # normalized demand (BUI_LOAD_norm.csv)
+   "day": lambda c: HEAT_SEASON if c.demand_day >= 0 else COOL_SEASON, # signed daily demand (BUI_LOAD_day.csv)
+}
+
+# SOC limits of charging: (heating target, cooling target, TARGET_SOC of control.csv)
+def limitsTarget(c):
+   return c.max_soc, c.min_soc, None
+
+# half-charged TES plus the daily demand
+def demandTarget(c):
+   target_soc = (1 + c.demand_day/(c.max_q_tes-c.min_q_tes))/2
+   target_soc = min(max(c.min_soc, target_soc), c.max_soc)
+   return target_soc, target_soc, target_soc
+
+# fully charged when PV overproduction is expected, else as demandTarget
+def pvTarget(c):
+   if any(c.st_on.values()):
+      target_soc = c.max_soc if c.getDemandType() == HEAT_SEASON else c.min_soc
+      return target_soc, target_soc, target_soc
+   return demandTarget(c)
+
+TARGETS = {"limits": limitsTarget, "demand": demandTarget, "pv": pvTarget}
+
+# seasonal heat in the TES (SEA_TOTAL_Q_TES of control.csv)
+def cappedSeasonalQ(c):
+   total_q_tes_capped = min(max(c.total_q_tes, c.min_q_tes), c.max_q_tes)
+   return total_q_tes_capped if c.getDemandType() == HEAT_SEASON else c.max_q_tes - total_q_tes_capped + c.min_q_tes
+
+def offsetSeasonalQ(c):
+   return c.total_q_tes - c.min_q_tes if c.getDemandType() == HEAT_SEASON else c.max_q_tes - c.total_q_tes # from 0 to MAX_Q_TES-MIN_Q_TES
+
+SEASONAL_QS = {"capped": cappedSeasonalQ, "offset": offsetSeasonalQ}
+
+# PV window: decides once per day when to charge the TES (decide), tells whether the current step is
+# in the charging time (charging) and forgets the decision once the TES is charged (stop)
+
+# the PV_SPAN with the highest predicted PV overproduction in the horizon (APCS1)
+class SpanWindow:
+   columns = (("START_TES_CHARGE_TIME", "start_tes_charge_time"),)
+   files = ()
+
+   def decide(self, c):
+      # time variable to check from CURRENT_STEP to CURRENT_STEP + PREDICTION HORIZON (e.g., 24h)
+      time = c.current_step
+      endtime = time + c.prediction_horizon
+      # the current highest value of PV production in each PV_SPAN (e.g., 4h)
+      best_pv = 0
+      # the time when highest PV production starts (time to charge the TES)
+      best_time = None
+      while time < endtime:
+         offset = 0
+         sum_pv = 0
+         # sum of PV overproduction of each time step of PV_SPAN
+         while offset < c.pv_span:
+            timestepkey = c.key(time+offset)
+            if timestepkey not in c.pvs or timestepkey not in c.el_decs:
+               sum_pv = -1
+               c.log("key not in", timestepkey)
+               break
+            pv_over_predicted = c.pvs[timestepkey] - (c.el_decs[timestepkey] + c.min_pv)
+            # if pv_over_predicted is less than zero we dont have overproduction and we discard this timestep
+            if pv_over_predicted < 0:
+               sum_pv = -1
+               break
+            sum_pv += pv_over_predicted
+            offset += STEP
+         if sum_pv > best_pv:
+            best_time = time
+            best_pv = sum_pv
+         time += STEP
+
+      # decision
+      if best_time:
+         c.start_tes_charge_time = best_time
+         c.selected_tes_charge_mode = TES_HEAT_MODE if c.getDemandType() == HEAT_SEASON else TES_COOL_MODE
+      else:
+         c.start_tes_charge_time = -1
+         c.selected_tes_charge_mode = TES_OFF_MODE
+
+   def charging(self, c):
+      return c.current_step >= c.start_tes_charge_time and c.current_step <= c.start_tes_charge_time + c.pv_span
+
+   def stop(self, c):
+      c.start_tes_charge_time = -1
+
+# every run of predicted PV overproduction of at least PV_SPAN_MIN in the horizon (APCS2..APCS6), written to st_on.csv.
+# by_key: the horizon ends at the key of its end time (APCS4..APCS6) rather than at the time itself
+class RunsWindow:
+   columns = ()
+   files = ("st_on.csv",)
+
+   def __init__(self, by_key):
+      self.by_key = by_key
+
+   def decide(self, c):
+      key = c.key
+      # time variable to check from CURRENT_STEP to CURRENT_STEP + PREDICTION HORIZON (e.g., 24h)
+      time = c.current_step
+      endtime = min(time + c.prediction_horizon, c.simul_end)
+      st_on = c.st_on = {}
+      # predicted PV overproduction of each time step of the horizon, read once (None if not predicted).
+      # a run of overproduction can be scanned up to the time step at endtime, hence the extra steps
+      firstkey = key(time)
+      stopkey = key(endtime) + 2
+      pvs, pvs_present = c.pvs.horizon(firstkey, stopkey)
+      el_decs, el_decs_present = c.el_decs.horizon(firstkey, stopkey)
+      pv_overs = [pv - (el_dec + c.min_pv) if pv_present and el_dec_present else None
+                  for pv, el_dec, pv_present, el_dec_present in zip(pvs, el_decs, pvs_present, el_decs_present)]
+      pv_overs += [None] * (stopkey - firstkey - len(pv_overs)) # past the end of the forecasts
+      # number of consecutive time steps with overproduction starting at each time step (maximal runs, one backward pass)
+      runs = [0] * (len(pv_overs) + 1)
+      for i in range(len(pv_overs) - 1, -1, -1):
+         # if pv_over_predicted is less than zero we dont have overproduction and the run stops
+         if pv_overs[i] is not None and pv_overs[i] >= 0:
+            runs[i] = runs[i+1] + 1
+      # offsets accumulated step by step like time, so that the comparisons with endtime and PV_SPAN_MIN are unchanged
+      offsets = [0]
+      for i in range(len(pv_overs)):
+         offsets.append(offsets[-1] + STEP)
+
+      while (key(time) < key(endtime)) if self.by_key else (time < endtime):
+         # overproduction run starting at time, cut at the end of the horizon
+         span = runs[key(time) - firstkey]
+         while span and time + offsets[span-1] >= endtime:
+            span -= 1
+         if time + offsets[span] < endtime and pv_overs[key(time) - firstkey + span] is None:
+            c.log("key not in", key(time) + span)
+         offset = offsets[span]
+         starttime = time
+         while key(time) < key(starttime+offset) and time < endtime:
+            decision = offset >= c.pv_span_min
+            st_on[key(time)] = decision
+            c.pston(time, decision)
+            time += STEP
+
+         time = min(time, endtime)
+         timestepkey = key(time)
+         c.log(timestepkey, time)
+         st_on[timestepkey] = False
+         c.pston(time, False)
+         time += STEP
+
+      c.selected_tes_charge_mode = TES_HEAT_MODE if c.getDemandType() == HEAT_SEASON else TES_COOL_MODE
+
+   def charging(self, c):
+      timestepkey = c.key(c.current_step)
+      return (c.st_on and c.st_on[timestepkey]) or (c.load_shift_on and c.load_shift_on[timestepkey])
+
+   def stop(self, c):
+      c.st_on = {}
+      c.load_shift_on = {}
+
+# no PV window of its own: the shift decides every charging step (OPTIMAL) and writes its ST_ON to st_on.csv
+class ScheduleWindow:
+   columns = ()
+   files = ("st_on.csv",)
+
+   def decide(self, c):
+      pass
+
+   charging = RunsWindow.charging
+   stop = RunsWindow.stop
+
+WINDOWS = {
+   "span": lambda: SpanWindow(),
+   "runs": lambda: RunsWindow(by_key=False),
+   "runs-by-key": lambda: RunsWindow(by_key=True),
+   "schedule": lambda: ScheduleWindow(),
+}
+
+# load shifting: when no PV overproduction is expected, charges in the TES_CHARGING_TIME cheapest steps of the
+# horizon, written to shift.csv (APCS4..APCS6)
+class PriceShift:
+   files = ("shift.csv",)
+
+   def decide(self, c):
+      key = c.key
+      load_shift_on = c.load_shift_on = {}
+      some_pv = any(c.st_on.values())
+      tes_charging_time = c.tes_charging_time_heat if c.getDemandType() == HEAT_SEASON else c.tes_charging_time_cool
+
+      time = c.current_step
+      endtime = min(time + c.prediction_horizon, c.simul_end)
+      times = []
+      prices = []
+
+      while key(time) < key(endtime):
+         times.append(time)
+         prices.append(c.prices[key(time)])
+         time += STEP
+
+      # exactly the TES_CHARGING_TIME cheapest steps of the horizon, compared on the PRICE values as read (not rounded),
+      # the earliest first among equal prices
+      lowest = bytearray(len(prices)) if some_pv else lowestMask(prices, int(tes_charging_time/STEP))
+
+      for time, selected in zip(times, lowest):
+         decision = selected == 1
+         load_shift_on[key(time)] = decision
+         c.logloadshift(time, decision)
+
+# least-cost charging schedule of `needed` steps (booleans, and its cost) given the cost of charging in each step,
+# by dynamic programming over (steps charged, length of the current charging run): a run lasts at least `min_run`
+# steps, and once the TES is charged a run only goes on to its minimum length. Among schedules of equal cost the
+# first one found wins, so the result is deterministic. O(len(costs) * needed * min_run)
+def optimalSchedule(costs, needed, min_run):
+   needed = min(needed, len(costs))
+   min_run = max(min_run, 1)
+   infinity = float("inf")
+   best = [[infinity] * (min_run + 1) for _ in range(needed + 1)]
+   best[0][0] = 0.0
+   parents = [] # per step, the state (charged, run) before the step of each state after it
+   for cost in costs:
+      after = [[infinity] * (min_run + 1) for _ in range(needed + 1)]
+      parent = [[None] * (min_run + 1) for _ in range(needed + 1)]
+      for charged in range(needed + 1):
+         for run, value in enumerate(best[charged]):
+            if value == infinity:
+               continue
+            # idle: only off or after a run of at least min_run steps
+            if (run == 0 or run == min_run) and value < after[charged][0]:
+               after[charged][0] = value
+               parent[charged][0] = (charged, run)
+            # charge
+            if charged < needed or 0 < run < min_run:
+               state = (min(charged + 1, needed), min(run + 1, min_run))
+               if value + cost < after[state[0]][state[1]]:
+                  after[state[0]][state[1]] = value + cost
+                  parent[state[0]][state[1]] = (charged, run)
+      best = after
+      parents.append(parent)
+
+   run = min(range(min_run + 1), key=best[needed].__getitem__)
+   total = best[needed][run]
+   charged = needed
+   schedule = [False] * len(costs)
+   for i in range(len(costs) - 1, -1, -1):
+      schedule[i] = run != 0
+      charged, run = parents[i][charged][run]
+   return schedule, total
+
+# optimal charging: charges the TES up to its target (CHARGE_RATE per step) at the least cost over the horizon, see
+# optimalSchedule. A step costs the PRICE of the heat pump electricity (MIN_PV) not covered by the predicted PV surplus
+# (PV_PRO - EL_DEC). The charging steps covered by PV go to ST_ON (st_on.csv), the others to LOAD_SHIFT_ON (shift.csv); the size,
+# cost and solver time of each decision are written to control-debug.log
+class OptimalShift:
+   files = ("shift.csv",)
+
+   def decide(self, c):
+      start = perf_counter()
+      key = c.key
+      time = c.current_step
+      endtime = min(time + c.prediction_horizon, c.simul_end)
+      times = []
+      costs = []
+      covered = []
+
+      while key(time) < key(endtime):
+         timestepkey = key(time)
+         surplus = c.pvs[timestepkey] - c.el_decs[timestepkey] if timestepkey in c.pvs and timestepkey in c.el_decs else 0
+         times.append(time)
+         costs.append(max(0, c.min_pv - surplus) / 1000 * STEP * c.prices[timestepkey])
+         covered.append(surplus >= c.min_pv)
+         time += STEP
+
+      # charging steps from the current SOC to the target of the season
+      missing_soc = c.heat_target - c.current_soc if c.getDemandType() == HEAT_SEASON else c.current_soc - c.cool_target
+      needed = max(0, math.ceil(missing_soc * (c.max_q_tes - c.min_q_tes) / (c.charge_rate * STEP)))
+      schedule, cost = optimalSchedule(costs, needed, int(round(c.min_charge_run / STEP)))
+
+      st_on = c.st_on = {}
+      load_shift_on = c.load_shift_on = {}
+      for time, charging, pv in zip(times, schedule, covered):
+         st_on[key(time)] = charging and pv
+         load_shift_on[key(time)] = charging and not pv
+         c.pston(time, st_on[key(time)])
+         c.logloadshift(time, load_shift_on[key(time)])
+      c.log("optimal schedule", c.current_step, needed, sum(schedule), cost, "%.6f" % (perf_counter() - start))
+
+SHIFTS = {"prices": lambda: PriceShift(), "optimal": lambda: OptimalShift()}
+
+# VARIANTS
+# window, shift (None: no load shifting), target, season, seasonal_q (None: not computed), key: strategies by name.
+# mode "decision": the charge mode is chosen by the daily decision, "step": at every step.
+# inputs: number of TRNSYS inputs read (7: no TOTAL_Q_TES)
+PRESETS = {
+   "APCS1": {"window": "span", "shift": None, "target": "limits", "season": "norm", "seasonal_q": None,
+             "key": "truncate", "mode": "decision", "inputs": 7,
+             "parameters": {"DECISION_HOUR": 6, "MAX_SOC": 1, "MIN_SOC": 0}},
+   "APCS2": {"window": "runs", "shift": None, "target": "limits", "season": "norm", "seasonal_q": "capped",
+             "key": "round", "mode": "decision", "inputs": 8,
+             "parameters": {"DECISION_HOUR": 6, "MAX_SOC": 1, "MIN_SOC": 0}},
+   "APCS3": {"window": "runs", "shift": None, "target": "demand", "season": "day", "seasonal_q": "offset",
+             "key": "round", "mode": "decision", "inputs": 8,
+             "parameters": {"DECISION_HOUR": 6, "MAX_SOC": 1, "MIN_SOC": 0, "MAX_Q_TES": 169, "MIN_Q_TES": 40}},
+   "APCS4": {"window": "runs-by-key", "shift": "prices", "target": "limits", "season": "norm", "seasonal_q": "capped",
+             "key": "round", "mode": "step", "inputs": 8, "parameters": {}},
+   "APCS5": {"window": "runs-by-key", "shift": "prices", "target": "demand", "season": "norm", "seasonal_q": "offset",
+             "key": "round", "mode": "step", "inputs": 8, "parameters": {}},
+   "APCS6": {"window": "runs-by-key", "shift": "prices", "target": "pv", "season": "norm", "seasonal_q": "offset",
+             "key": "round", "mode": "step", "inputs": 8, "parameters": {}},
+   # APCS5 with the optimal charging schedule, no script
+   "OPTIMAL": {"window": "schedule", "shift": "optimal", "target": "demand", "season": "norm", "seasonal_q": "offset",
+               "key": "round", "mode": "step", "inputs": 8, "parameters": {}},
+}
+
+# presets reproducing an APCS script (see conformance.py)
+SCRIPTED = ["APCS1", "APCS2", "APCS3", "APCS4", "APCS5", "APCS6"]
+
+# Controller of one TES configured by a preset, with its input series and output files in `directory`
+# (control.csv, control-debug.log, and st_on.csv/shift.csv if its strategies write them).
+# Parameters override the PARAMETERS of the preset, e.g. Engine("APCS5", PV_SPAN_MIN=1.0)
+class Engine:
+   __slots__ = ("preset", "key", "window", "shift", "target", "season", "seasonal_q", "mode", "inputs", "row", "outputs",
+                "pv_span", "pv_span_min", "decision_hour", "prediction_horizon", "min_pv", "max_soc", "min_soc",
+                "soc_discharged_heat", "soc_discharged_cool", "max_q_tes", "min_q_tes", "simul_end",
+                "tes_charging_time_heat", "tes_charging_time_cool", "charge_rate", "min_charge_run",
+                "demands_norm", "demands_day", "pvs", "el_decs", "prices",
+                "f_print", "f_log", "st_on_print", "load_shift_print",
+                "current_step",
+                "day_of_year", "current_soc", "current_pv", "current_el_tot", "current_demand", "t1_bot", "t_mix_out", "total_q_tes",
+                "start_tes_charge_time", "st_on", "load_shift_on", "selected_tes_charge_mode", "current_pv_over",
+                "heat_target", "cool_target", "target_soc", "sea_total_q_tes",
+                "tes_heat_on", "tes_cool_on", "sc2", "demand_norm", "demand_day")
+
+   def __init__(self, preset="APCS5", directory=".", trace_format="csv", flush_interval=1.0, trace_checkpoint=0, **parameters):
+      config = PRESETS[preset]
+      self.preset = preset
+      self.key = KEYS[config["key"]]
+      self.window = WINDOWS[config["window"]]()
+      self.shift = SHIFTS[config["shift"]]() if config["shift"] else None
+      self.target = TARGETS[config["target"]]
+      self.season = SEASONS[config["season"]]
+      self.seasonal_q = SEASONAL_QS[config["seasonal_q"]] if config["seasonal_q"] else None
+      self.mode = config["mode"]
+      self.inputs = config["inputs"]
+      values = dict(PARAMETERS)
+      values.update(config["parameters"])
+      for name, value in parameters.items():
+         if name not in PARAMETERS:
+            raise ValueError("unknown parameter %s" % name)
+         values[name] = value
+      for name, value in values.items():
+         setattr(self, name.lower(), value)
+
+      # input series, only those read by the strategies
+      path = lambda name: os.path.join(directory, name)
+      self.demands_norm = dict(loadSeries(path(DEMAND_PATH), "day").items()) if config["season"] == "norm" else None
+      self.demands_day = dict(loadSeries(path(DEMAND_DAY_PATH), "day").items()) if config["season"] == "day" or config["target"] != "limits" else None
+      # the forecasts are stored under the time step keys of the preset (timeseries.KEYS)
+      series_key = "truncate" if config["key"] == "truncate" else "step"
+      self.pvs = loadSeries(path(PV_PATH), series_key)
+      self.el_decs = loadSeries(path(EL_DEC_PATH), series_key)
+      self.prices = loadSeries(path(PRICE_PATH), series_key) if self.shift else None
+
+      # output files
+      self.f_print = openTrace(path("control"), trace_format, flush_interval, trace_checkpoint)
+      self.st_on_print = openSink(path("st_on.csv"), flush_interval) if "st_on.csv" in self.window.files else None
+      self.f_log = openSink(path("control-debug.log"), flush_interval)
+      self.load_shift_print = openSink(path("shift.csv"), flush_interval) if self.shift else None
+
+      # TIME
+      self.current_step = 0.0
+
+      # INPUTS with initial values
+      self.day_of_year = 0
+      self.current_soc = 0
+      self.current_pv = 0
+      self.current_el_tot = 0
+      self.current_demand = 0
+      self.t1_bot = 0
+      self.t_mix_out = 0
+      self.total_q_tes = 0
+
+      # INTERMEDIATES (values computed at each timestep which are not outputs nor inputs)
+      self.start_tes_charge_time = -1
+      self.st_on = {}
+      self.load_shift_on = {}
+      self.selected_tes_charge_mode = TES_OFF_MODE
+      self.current_pv_over = 0
+      self.heat_target = self.cool_target = self.target_soc = 0
+      self.sea_total_q_tes = 0 # seasonal Q in TES
+
+      # OUTPUTS
+      self.tes_heat_on = 0 # control signal of TES charging in heating mode
+      self.tes_cool_on = 0 # control signal of TES charging in cooling mode
+      self.sc2 = 0 # regulates the TES PUMP
+      self.demand_norm = 0 # current normalized demand (for the day)
+      self.demand_day = 0 # daily demand
+
+      # control.csv: the columns of the variant
+      demand = ("DEMAND_DAY", "demand_day") if config["season"] == "day" else ("DEMAND_NORM", "demand_norm")
+      columns = [("CURRENT_STEP", "current_step"), ("CURRENT_SOC", "current_soc"), ("DAY_OF_YEAR", "day_of_year"),
+                 ("CURRENT_PV", "current_pv"), ("TES_HEAT_ON", "tes_heat_on"), ("TES_COOL_ON", "tes_cool_on")]
+      columns += self.window.columns
+      columns += [("SELECTED_TES_CHARGE_MODE", "selected_tes_charge_mode"), ("SC2", "sc2"), demand,
+                  ("CURRENT_PV_OVER", "current_pv_over"), ("CURRENT_DEMAND", "current_demand"), ("T1_BOT", "t1_bot"), ("T_MIX_OUT", "t_mix_out")]
+      if self.seasonal_q:
+         columns += [("TOTAL_Q_TES", "total_q_tes"), ("SEA_TOT_Q_TES", "sea_total_q_tes")]
+      if config["target"] != "limits":
+         columns.append(("TARGET_SOC", "target_soc"))
+      self.row = operator.attrgetter(*[attribute for _, attribute in columns])
+      self.outputs = operator.attrgetter("tes_heat_on", "tes_cool_on", "sc2", demand[1])
+      self.f_print.header(",".join(name for name, _ in columns))
+      if self.st_on_print:
+         self.logston("TIME,ST_ON,PV_OVER_PRED,PV_PRED,EL_DEC_PRED")
+
+   # one call of TRNSYS at timestep with the TRNSYS inputs (SOC, DAY_OF_YEAR, PV, DEMAND, EL_TOT, T1_BOT, T_MIX_OUT[, TOTAL_Q_TES]).
+   # The logic runs on the inputs of the previous call; returns the outputs (TES_HEAT_ON, TES_COOL_ON, SC2, DEMAND_NORM or DEMAND_DAY)
+   def step(self, timestep, inputs):
+      # avoid executing logic multiple times for timestep because in the deck there are loops and this function will be called multiple times per timestep
+      if self.current_step != timestep:
+         self.compute() # main logic
+         # prints in control.csv
+         self.f_print.row(self.row(self))
+      self.current_soc, self.day_of_year, self.current_pv, self.current_demand, self.current_el_tot, self.t1_bot, self.t_mix_out = inputs[:7]
+      if self.inputs > 7:
+         self.total_q_tes = inputs[7]
+
+      self.current_step = timestep
+
+      return self.outputs(self)
+
+   # main logic
+   def compute(self):
+      self.prepareIntermediates()
+      # TES charging time is decided once per day at DECISION_HOUR
+      if self.current_step.is_integer() and self.current_step % 24 == self.decision_hour:
+         self.window.decide(self)
+         if self.shift:
+            self.shift.decide(self)
+      self.setTESMode()
+      self.setPumpMode()
+
+   def prepareIntermediates(self):
+      if self.day_of_year != 0:
+         if self.demands_norm is not None:
+            self.demand_norm = self.demands_norm[self.day_of_year]
+         if self.demands_day is not None:
+            self.demand_day = self.demands_day[self.day_of_year]
+      self.current_pv_over = max(0, self.current_pv - self.current_el_tot)
+      if self.seasonal_q:
+         self.sea_total_q_tes = self.seasonal_q(self)
+      self.heat_target, self.cool_target, self.target_soc = self.target(self)
+      if self.mode == "step":
+         self.selected_tes_charge_mode = TES_HEAT_MODE if self.getDemandType() == HEAT_SEASON else TES_COOL_MODE
+
+   # set the TES control signal at each time step (action, not decision)
+   def setTESMode(self):
+      self.tes_cool_on = self.tes_heat_on = 0
+
+      # if we are in the time to charge the TES and TES is not fully charged
+      if self.window.charging(self):
+         if self.selected_tes_charge_mode == TES_HEAT_MODE and self.current_soc <= self.heat_target:
+            self.tes_heat_on = 1
+         elif self.selected_tes_charge_mode == TES_COOL_MODE and self.current_soc >= self.cool_target:
+            self.tes_cool_on = 1
+
+      # stop charging if fully charged
+      if self.selected_tes_charge_mode == TES_HEAT_MODE and self.current_soc > self.heat_target:
+         self.window.stop(self)
+         self.selected_tes_charge_mode = TES_HEAT_OFF
+      elif self.selected_tes_charge_mode == TES_COOL_MODE and self.current_soc < self.cool_target:
+         self.window.stop(self)
+         self.selected_tes_charge_mode = TES_HEAT_OFF
+
+   def setPumpMode(self):
+      soc_discharged = self.current_soc <= self.soc_discharged_heat if self.getDemandType() == HEAT_SEASON else self.current_soc >= self.soc_discharged_cool
+      # in heating TES is discharged if the temperature inside the TES is lower than distribution temperature (viceversa in cooling)
+      temp_discharged = self.t1_bot <= self.t_mix_out if self.getDemandType() == HEAT_SEASON else self.t1_bot >= self.t_mix_out
+
+      if self.tes_heat_on or self.tes_cool_on: # pump open in CHARGING MODE
+         self.sc2 = TES_PUMP_ON
+      elif not self.current_pv_over and self.current_demand and not soc_discharged and not temp_discharged: # pump open in DISCHARGING MODE for user needs
+         self.sc2 = TES_PUMP_ON
+      else:
+         self.sc2 = TES_PUMP_OFF
+
+   def getDemandType(self):
+      return self.season(self)
+
+   def log(self, *args):
+      self.f_log.write(",".join([str(a) for a in args])+"\n")
+
+   def logston(self, *args):
+      self.st_on_print.write(",".join([str(a) for a in args])+"\n")
+
+   def pston(self, time, decision):
+      timestepkey = self.key(time)
+      pv_predicted = self.pvs[timestepkey]
+      el_dec_predicted = self.el_decs[timestepkey]
+      pv_over_predicted = max(0, pv_predicted - (el_dec_predicted + self.min_pv))
+      self.logston(time, decision, pv_over_predicted, pv_predicted, el_dec_predicted)
+
+   def logloadshift(self, *args):
+      self.load_shift_print.write(",".join([str(a) for a in args])+"\n")
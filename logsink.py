@@ -0,0 +1,184 @@
+import threading
+import zipfile
+import atexit
+import time
+import struct
+import array
+import sys
+import os
+
+# sinks opened by the controller, flushed together by flushSinks()
+SINKS = []
+
+# BACKGROUND WRITER
+# one thread for the whole process, whatever the number of controllers: it writes each open buffered sink
+# every `interval` seconds of that sink. It is started with the first buffered sink (again in a forked process)
+BUFFERED = []
+WRITER = None
+WRITER_LOCK = threading.Lock()
+WAKE = threading.Event() # a sink was opened: the writer computes its next wake-up again
+
+def register(sink):
+   global WRITER
+   with WRITER_LOCK:
+      BUFFERED.append(sink)
+      if WRITER is None or not WRITER.is_alive():
+         WRITER = threading.Thread(target=writeSinks, daemon=True)
+         WRITER.start()
+   WAKE.set()
+
+def unregister(sink):
+   with WRITER_LOCK:
+      if sink in BUFFERED:
+         BUFFERED.remove(sink)
+
+def writeSinks():
+   while True:
+      with WRITER_LOCK:
+         sinks = list(BUFFERED)
+      now = time.monotonic()
+      for sink in sinks:
+         if now >= sink.due:
+            sink.flush()
+            sink.due = now + sink.interval
+      timeout = min((sink.due for sink in sinks), default=now + 1.0) - time.monotonic()
+      WAKE.wait(max(timeout, 0))
+      WAKE.clear()
+
+# Output file of a controller (control.csv, st_on.csv, shift.csv, control-debug.log) written through a bounded
+# in-memory buffer. The background writer writes the buffer every `interval` seconds; it is also written when it
+# holds `capacity` lines, on flush() and at exit. Lines are written in the order they were given
+class BufferedSink:
+   def __init__(self, path, interval=1.0, capacity=4096):
+      self.file = open(path, "w")
+      self.lines = []
+      self.capacity = capacity
+      self.lock = threading.Lock()
+      self.interval = interval
+      self.due = time.monotonic() + interval
+      register(self)
+
+   def write(self, text):
+      with self.lock:
+         self.lines.append(text)
+         if len(self.lines) >= self.capacity:
+            self.writeLines()
+
+   # requires the lock
+   def writeLines(self):
+      if self.file.closed:
+         return
+      self.file.write("".join(self.lines))
+      self.lines = []
+      self.file.flush()
+
+   def flush(self):
+      with self.lock:
+         self.writeLines()
+
+   def close(self):
+      unregister(self)
+      with self.lock:
+         self.writeLines()
+         self.file.close()
+
+# Unbuffered output file: every line is written and flushed at once (behaviour of the controllers before the sinks)
+class DirectSink:
+   def __init__(self, path):
+      self.file = open(path, "w")
+
+   def write(self, text):
+      self.file.write(text)
+      self.file.flush()
+
+   def flush(self):
+      self.file.flush()
+
+   def close(self):
+      self.file.close()
+
+# opens an output file of the controller: buffered, written every `interval` seconds, or direct if interval is 0
+def openSink(path, interval):
+   sink = BufferedSink(path, interval) if interval > 0 else DirectSink(path)
+   SINKS.append(sink)
+   return sink
+
+# PER-STEP TRACE (control.csv)
+# a trace receives the column names once, then one row of values per simulation step
+
+# csv trace: each row as a line of comma-joined str() values, through a sink (the format of control.csv)
+class CsvTrace:
+   def __init__(self, sink):
+      self.sink = sink
+
+   def header(self, names):
+      self.sink.write(names + "\n")
+
+   def row(self, values):
+      self.sink.write(",".join([str(v) for v in values]) + "\n")
+
+# columnar trace: each column is a preallocated float64 array (doubled when full) and a row is stored without
+# any formatting. The columns are written as a compressed .npz (one .npy per column, numpy.load reads it)
+# at exit, on flush() and every `checkpoint` rows if given
+class ColumnTrace:
+   def __init__(self, path, capacity=96000, checkpoint=0):
+      self.path = path
+      self.capacity = capacity
+      self.checkpoint = checkpoint
+      self.names = []
+      self.columns = []
+      self.count = 0
+
+   def header(self, names):
+      self.names = names.split(",")
+      self.columns = [array.array('d', bytes(8 * self.capacity)) for _ in self.names]
+
+   def row(self, values):
+      if self.count == self.capacity:
+         for column in self.columns:
+            column.frombytes(bytes(8 * self.capacity))
+         self.capacity *= 2
+      for column, value in zip(self.columns, values):
+         column[self.count] = value
+      self.count += 1
+      if self.checkpoint and self.count % self.checkpoint == 0:
+         self.flush()
+
+   # writes the rows so far, replacing the previous checkpoint at once
+   def flush(self):
+      with zipfile.ZipFile(self.path + ".tmp", mode="w", compression=zipfile.ZIP_DEFLATED) as npz:
+         for name, column in zip(self.names, self.columns):
+            npz.writestr(name + ".npy", npyBytes(column[:self.count]))
+      os.replace(self.path + ".tmp", self.path)
+
+   def close(self):
+      self.flush()
+
+# .npy file (format version 1.0) of a float64 array
+def npyBytes(values):
+   header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d,), }" % len(values)
+   header += " " * (-(10 + len(header) + 1) % 64) + "\n" # the data starts 64-byte aligned
+   if sys.byteorder == "big":
+      values = array.array('d', values)
+      values.byteswap()
+   return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1") + values.tobytes()
+
+# opens the per-step trace `name`: name.csv through a sink (see openSink), or name.npz if format is "npz",
+# also written every `checkpoint` rows if given
+def openTrace(name, format, interval, checkpoint=0):
+   if format == "npz":
+      trace = ColumnTrace(name + ".npz", checkpoint=checkpoint)
+      SINKS.append(trace)
+      return trace
+   return CsvTrace(openSink(name + ".csv", interval))
+
+def flushSinks():
+   for sink in SINKS:
+      sink.flush()
+
+def closeSinks():
+   for sink in SINKS:
+      sink.close()
+
+# TRNSYS finalizes the interpreter at the end of the simulation (see Type1691.cpp), which runs this
+atexit.register(closeSinks)
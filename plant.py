@@ -0,0 +1,84 @@
+import numpy as np
+
+# Reduced-order model of the TES and its heat pumps, driven by the controller outputs, for closed-loop replays
+# (see replay.py). The tank is a single lumped capacity: its stored heat q (kWh) stays between MIN_Q_TES (fully
+# charged in cooling mode) and MAX_Q_TES (fully charged in heating mode) and gives the SOC and the tank temperature
+# linearly. The state is held in numpy arrays of `units` tanks, so one model can step many runs at once
+class TESPlant:
+   def __init__(self, max_q=161.08, min_q=20.94, step=6/60, soc=0.5, units=1,
+                hp_power=12600, cop=3.0, demand_power=40.0, discharge_power=40.0,
+                t_empty=10.0, t_full=40.0, t_ambient=20.0, loss_time=240.0):
+      self.max_q = max_q
+      self.min_q = min_q
+      self.step = step # hours
+      self.hp_power = hp_power # W of electricity drawn by the heat pumps when charging (MIN_PV of the controllers)
+      self.cop = cop
+      self.demand_power = demand_power # kW taken from the TES for a CURRENT_DEMAND of 1
+      self.discharge_power = discharge_power # kW, largest discharge of the TES pump
+      self.t_empty = t_empty # tank temperature at SOC 0 and SOC 1
+      self.t_full = t_full
+      self.t_ambient = t_ambient
+      self.loss_time = loss_time # hours, time constant of the standby losses
+      self.q = np.full(units, min_q + soc * (max_q - min_q))
+      # what the tank holds: heat (True) or cold, set by the last charge. Discharging moves q back towards it
+      self.heating = np.ones(units, dtype=bool)
+      self.el_hp = np.zeros(units)
+
+   # plant of the controller module, with its TES capacity and heat pump power where it defines them
+   @classmethod
+   def forController(cls, module, **options):
+      if getattr(module, "ENGINE", None) is not None: # APCS.py
+         return cls.forEngine(module.ENGINE, **options)
+      for name, option in (("MAX_Q_TES", "max_q"), ("MIN_Q_TES", "min_q"), ("STEP", "step"), ("MIN_PV", "hp_power")):
+         if hasattr(module, name):
+            options.setdefault(option, getattr(module, name))
+      return cls(**options)
+
+   # plant of an engine.Engine, with the TES capacity and heat pump power of its preset
+   @classmethod
+   def forEngine(cls, engine, **options):
+      options.setdefault("max_q", engine.max_q_tes)
+      options.setdefault("min_q", engine.min_q_tes)
+      options.setdefault("hp_power", engine.min_pv)
+      return cls(**options)
+
+   @property
+   def soc(self):
+      return (self.q - self.min_q) / (self.max_q - self.min_q)
+
+   # tank temperature (TES bottom temperature of the deck); stratification is not modelled
+   @property
+   def t1_bot(self):
+      return self.t_empty + self.soc * (self.t_full - self.t_empty)
+
+   # advances the tanks by one step given the controller outputs and the heat demand (arrays of `units` values or scalars)
+   def advance(self, heat_on, cool_on, pump_on, demand):
+      heat_on = np.asarray(heat_on) != 0
+      cool_on = np.asarray(cool_on) != 0
+      charging = heat_on | cool_on
+      self.heating = np.where(heat_on, True, np.where(cool_on, False, self.heating))
+
+      charge = self.hp_power * self.cop / 1000 * self.step
+      discharge = np.minimum(np.asarray(demand) * self.demand_power, self.discharge_power) * self.step
+      discharge = np.where((np.asarray(pump_on) != 0) & ~charging, discharge, 0.0)
+      q_ambient = self.min_q + (self.t_ambient - self.t_empty) / (self.t_full - self.t_empty) * (self.max_q - self.min_q)
+      dq = charge * heat_on - charge * cool_on + np.where(self.heating, -discharge, discharge)
+      dq += (q_ambient - self.q) * self.step / self.loss_time
+      self.q = np.clip(self.q + dq, self.min_q, self.max_q)
+      self.el_hp = np.where(charging, float(self.hp_power), np.zeros_like(self.q))
+
+   # recorded TRNSYS inputs of one step (SOC, DAY_OF_YEAR, PV, DEMAND, EL_TOT, T1_BOT, T_MIX_OUT, TOTAL_Q_TES) with
+   # the plant state of the first tank in place of the recorded one. The recorded EL_TOT is taken as the consumption
+   # without the heat pumps
+   def inputs(self, recorded):
+      inputs = list(recorded)
+      inputs[0] = float(self.soc[0])
+      inputs[4] = recorded[4] + float(self.el_hp[0])
+      inputs[5] = float(self.t1_bot[0])
+      if len(inputs) > 7:
+         inputs[7] = float(self.q[0])
+      return tuple(inputs)
+
+   # advances the first tank from the outputs set by the controller during the step (TES_HEAT_ON, TES_COOL_ON, SC2)
+   def update(self, outputs, recorded):
+      self.advance(outputs.get(1, 0), outputs.get(2, 0), outputs.get(3, 0), recorded[3])
@@ -0,0 +1,247 @@
+import traceback
+from timeseries import loadSeries
+from logsink import openSink, openTrace, flushSinks
+
+# --- GLOBAL VARIABLES ---
+
+LOG_FLUSH_INTERVAL = 1.0 # seconds between writes of the output files (0 writes and flushes each line at once)
+TRACE_FORMAT = "csv" # per-step trace: "csv" for control.csv, "npz" for typed columns in control.npz
+TRACE_CHECKPOINT = 0 # rows between two writes of control.npz, so that a crashed simulation keeps its trace (0: at exit or on error only)
+F_PRINT = openTrace("control", TRACE_FORMAT, LOG_FLUSH_INTERVAL, TRACE_CHECKPOINT)
+F_LOG = openSink("control-debug.log", LOG_FLUSH_INTERVAL)
+
+# files
+PV_PATH = "PV_PRO.csv"
+DEMAND_PATH = "BUI_LOAD_norm.csv"
+EL_DEC_PATH = "EL_DEC.csv"
+
+DEMANDS_NORM = None
+PVS = None
+EL_DECS = None
+
+# TIME
+STEP = 6/60
+
+# PARAMS (to be decided by user)
+PV_SPAN = 4.0 # time period that in each PV production is evaluated (should be almost equal to time to charge the TES)
+DECISION_HOUR = 6 # time of the day when decision of TES charging is taken
+PREDICTION_HORIZON = 24
+MIN_PV = 12600 # threshold of PV production which is equal to minimum power rate of heatpumps
+MAX_SOC = 1 # fully charged value of TES SOC in heating mode
+MIN_SOC = 0 # fully charged value of TES SOC in cooling mode
+SOC_DISCHARGED_HEAT = 0.05 # threshold of fully discharged TES in heating mode (e.g., < 0.05). Value decided based on temperature reported in the deliverable.
+SOC_DISCHARGED_COOL = 0.95 # threshold of fully discharged TES in cooling mode (e.g., > 0.95). Value decided based on temperature reported in the deliverable.
+
+# CONSTANTS
+TES_OFF_MODE = 0
+TES_HEAT_MODE = HEAT_SEASON = 1
+TES_COOL_MODE = COOL_SEASON = -1
+TES_HEAT_OFF = 0 # control signal of TES charging in heating mode
+TES_PUMP_ON = 1
+TES_PUMP_OFF = 0
+
+# controller driven by TRNSYS, see Controller
+CONTROLLER = None
+
+
+# --- END OF GLOBAL VARIABLES ---
+
+# function called by TRNSYS (Type169)
+def main():
+   try:
+      timestep = TRNSYS.getSimulationTime() # requires modified Type169 that allows to read the timestep in the Python environment
+      outputs = CONTROLLER.step(timestep, [TRNSYS.getInputValue(i) for i in range(1, 8)])
+      for i, value in enumerate(outputs, 1):
+         TRNSYS.setOutputValue(i, value)
+
+   except Exception as err:
+      log(traceback.format_exc()) # logs error
+      flushSinks() # the buffered output files are complete up to the error
+      raise err
+
+# State of one controlled TES (inputs of the last timestep, decisions and outputs), stepped once per TRNSYS call.
+# The parameters and input files are the module globals above; main() steps the CONTROLLER instance
+class Controller:
+   __slots__ = ("current_step",
+                "day_of_year", "current_soc", "current_pv", "current_el_tot", "current_demand", "t1_bot", "t_mix_out",
+                "start_tes_charge_time", "selected_tes_charge_mode", "current_pv_over",
+                "tes_heat_on", "tes_cool_on", "sc2", "demand_norm")
+
+   def __init__(self):
+      # TIME
+      self.current_step = 0.0
+
+      # INPUTS with initial values
+      self.day_of_year = 0
+      self.current_soc = 0
+      self.current_pv = 0
+      self.current_el_tot = 0
+      self.current_demand = 0
+      self.t1_bot = 0
+      self.t_mix_out = 0
+
+      # INTERMEDIATES (values computed at each timestep which are not outputs nor inputs)
+      self.start_tes_charge_time = -1
+      self.selected_tes_charge_mode = TES_OFF_MODE
+      self.current_pv_over = 0
+
+      # OUTPUTS
+      self.tes_heat_on = 0 # control signal of TES charging in heating mode
+      self.tes_cool_on = 0 # control signal of TES charging in cooling mode
+      self.sc2 = 0 # regulates the TES PUMP
+      self.demand_norm = 0 # current normalized demand (for the day)
+
+   # one call of TRNSYS at timestep with the TRNSYS inputs (SOC, DAY_OF_YEAR, PV, DEMAND, EL_TOT, T1_BOT, T_MIX_OUT).
+   # The logic runs on the inputs of the previous call; returns the outputs (TES_HEAT_ON, TES_COOL_ON, SC2, DEMAND_NORM)
+   def step(self, timestep, inputs):
+      # avoid executing logic multiple times for timestep because in the deck there are loops and this function will be called multiple times per timestep
+      if self.current_step != timestep: 
+         self.compute() # main logic
+         # prints in control.csv
+         pprint(self.current_step, self.current_soc, self.day_of_year, self.current_pv, self.tes_heat_on, self.tes_cool_on, self.start_tes_charge_time, self.selected_tes_charge_mode, self.sc2, self.demand_norm, self.current_pv_over, self.current_demand, self.t1_bot, self.t_mix_out)
+
+      self.current_soc, self.day_of_year, self.current_pv, self.current_demand, self.current_el_tot, self.t1_bot, self.t_mix_out = inputs
+
+      self.current_step = timestep
+
+      return self.tes_heat_on, self.tes_cool_on, self.sc2, self.demand_norm
+
+   # main logic
+   def compute(self):
+      self.prepareIntermediates()
+      # TES charging time is decided once per day at DECISION_HOUR
+      if self.current_step.is_integer() and self.current_step % 24 == DECISION_HOUR: 
+         self.decideTESChargingPred()
+      self.setTESMode()
+      self.setPumpMode()
+
+   def prepareIntermediates(self):
+      if self.day_of_year != 0:
+         self.demand_norm = DEMANDS_NORM[self.day_of_year]
+      self.current_pv_over = max(0, self.current_pv - self.current_el_tot)
+
+   # Prediction mode: pick the best time period (PV_SPAN) in the next 24h to charge the TES
+   # Decides when to charge the TES (START_TES_CHARGE_TIME) and in which mode (SELECTED_TES_CHARGE_MODE)
+   def decideTESChargingPred(self):
+      # time variable to check from CURRENT_STEP to CURRENT_STEP + PREDICTION HORIZON (e.g., 24h)
+      time = self.current_step
+      endtime = time + PREDICTION_HORIZON
+      # the current highest value of PV production in each PV_SPAN (e.g., 4h)
+      best_pv = 0
+      # the time when highest PV production starts (time to charge the TES)
+      best_time = None
+      while time < endtime:
+         offset = 0
+         sum_pv = 0
+         # sum of PV overproduction of each time step of PV_SPAN 
+         while offset < PV_SPAN:
+            timestepkey = getTimeStepKey(time+offset)
+            if timestepkey not in PVS or timestepkey not in EL_DECS:
+               sum_pv = -1
+               log("key not in", timestepkey)
+               break
+            pv_predicted = PVS[timestepkey]
+            el_dec_predicted = EL_DECS[timestepkey]
+            pv_over_predicted = pv_predicted - (el_dec_predicted + MIN_PV)
+            # if pv_over_predicted is less than zero we dont have overproduction and we discard this timestep
+            if pv_over_predicted < 0:
+               sum_pv = -1
+               break
+            sum_pv += pv_over_predicted
+            offset += STEP
+         if sum_pv > best_pv:
+            best_time = time 
+            best_pv = sum_pv
+         time += STEP
+
+      # decision
+      if best_time:
+         self.start_tes_charge_time = best_time
+         self.selected_tes_charge_mode = TES_HEAT_MODE if self.getDemandType() == HEAT_SEASON else TES_COOL_MODE
+      else:
+         self.start_tes_charge_time = -1
+         self.selected_tes_charge_mode = TES_OFF_MODE
+
+   # set the TES control signal at each time step (action, not decision)
+   def setTESMode(self):
+      self.tes_cool_on = self.tes_heat_on = 0
+      
+      # if we are in the time to charge the TES and TES is not fully charged
+      if self.current_step >= self.start_tes_charge_time and self.current_step <= self.start_tes_charge_time + PV_SPAN:
+         if self.selected_tes_charge_mode == TES_HEAT_MODE and self.current_soc <= MAX_SOC:
+            self.tes_heat_on = 1
+         elif self.selected_tes_charge_mode == TES_COOL_MODE and self.current_soc >= MIN_SOC:
+            self.tes_cool_on = 1
+         
+      # stop charging if fully charged
+      if self.selected_tes_charge_mode == TES_HEAT_MODE and self.current_soc > MAX_SOC:
+         self.start_tes_charge_time = -1 
+         self.selected_tes_charge_mode = TES_HEAT_OFF
+      elif self.selected_tes_charge_mode == TES_COOL_MODE and self.current_soc < MIN_SOC:
+         self.start_tes_charge_time = -1
+         self.selected_tes_charge_mode = TES_HEAT_OFF
+
+
+   def setPumpMode(self):
+      soc_discharged = self.current_soc <= SOC_DISCHARGED_HEAT if self.getDemandType() == HEAT_SEASON else self.current_soc >= SOC_DISCHARGED_COOL
+      # in heating TES is discharged if the temperature inside the TES is lower than distribution temperature (viceversa in cooling)
+      temp_discharged = self.t1_bot <= self.t_mix_out if self.getDemandType() == HEAT_SEASON else self.t1_bot >= self.t_mix_out
+
+      if self.tes_heat_on or self.tes_cool_on: # pump open in CHARGING MODE
+         self.sc2 = TES_PUMP_ON
+      elif not self.current_pv_over and self.current_demand and not soc_discharged and not temp_discharged: # pump open in DISCHARGING MODE for user needs
+         self.sc2 = TES_PUMP_ON
+      else:
+         self.sc2 = TES_PUMP_OFF
+
+   def getDemandType(self):
+      return HEAT_SEASON if self.demand_norm >= 0.5 else COOL_SEASON
+   
+   
+def getTimeStepKey(timestep):
+   return int(float(timestep)*10)
+
+def setupFiles():
+   global DEMANDS_NORM, PVS, EL_DECS
+   DEMANDS_NORM = dict(loadSeries(DEMAND_PATH, "day").items())
+
+   # stored under the truncated keys of getTimeStepKey, like the lookups
+   PVS = loadSeries(PV_PATH, "truncate")
+
+   EL_DECS = loadSeries(EL_DEC_PATH, "truncate")
+
+def log(*args):
+   F_LOG.write(",".join([str(a) for a in args])+"\n")
+
+def pprint(*args):
+   F_PRINT.row(args)
+
+# initialization
+setupFiles()
+CONTROLLER = Controller()
+F_PRINT.header("CURRENT_STEP,CURRENT_SOC,DAY_OF_YEAR,CURRENT_PV,TES_HEAT_ON,TES_COOL_ON,START_TES_CHARGE_TIME,SELECTED_TES_CHARGE_MODE,SC2,DEMAND_NORM,CURRENT_PV_OVER,CURRENT_DEMAND,T1_BOT,T_MIX_OUT")
+
+
+
+### --- DEBUG SECTION !DO NOT TOUCH! ---
+
+class TRNSYS_MOCK:
+   i = 6.0
+   def getInputValue(self, *args):
+      return 10
+   def setOutputValue(self,*args):
+      pass
+   def getSimulationTime(self):
+      self.i += 1
+      return self.i
+
+# settings DANGEROUS. DO NOT CHANGE. SHOULD BE FALSE
+DEBUG = False
+if DEBUG:   
+   TRNSYS = TRNSYS_MOCK()
+else:
+   import TRNSYSpy as TRNSYS
+
+if DEBUG:
+   main()
+   main()
\ No newline at end of file
@@ -0,0 +1,282 @@
+import traceback
+from timeseries import loadSeries
+from logsink import openSink, openTrace, flushSinks
+
+# --- GLOBAL VARIABLES ---
+
+LOG_FLUSH_INTERVAL = 1.0 # seconds between writes of the output files (0 writes and flushes each line at once)
+TRACE_FORMAT = "csv" # per-step trace: "csv" for control.csv, "npz" for typed columns in control.npz
+TRACE_CHECKPOINT = 0 # rows between two writes of control.npz, so that a crashed simulation keeps its trace (0: at exit or on error only)
+F_PRINT = openTrace("control", TRACE_FORMAT, LOG_FLUSH_INTERVAL, TRACE_CHECKPOINT)
+ST_ON_PRINT = openSink("st_on.csv", LOG_FLUSH_INTERVAL)
+F_LOG = openSink("control-debug.log", LOG_FLUSH_INTERVAL)
+
+# files
+PV_PATH = "PV_PRO.csv"
+DEMAND_PATH = "BUI_LOAD_day.csv"
+EL_DEC_PATH = "EL_DEC.csv"
+
+DEMANDS_DAY = None
+PVS = None
+EL_DECS = None
+
+# TIME
+STEP = 6/60
+
+# PARAMS (to be decided by user)
+PV_SPAN_MIN = 0.5
+DECISION_HOUR = 6 # time of the day when decision of TES charging is taken
+PREDICTION_HORIZON = 24
+MIN_PV = 12600 # threshold of PV production which is equal to minimum power rate of heatpumps
+MAX_SOC = 1 # fully charged value of TES SOC in heating mode
+MIN_SOC = 0 # fully charged value of TES SOC in cooling mode
+SOC_DISCHARGED_HEAT = 0.05 # threshold of fully discharged TES in heating mode (e.g., < 0.05). Value decided based on temperature reported in the deliverable.
+SOC_DISCHARGED_COOL = 0.95 # threshold of fully discharged TES in cooling mode (e.g., > 0.95). Value decided based on temperature reported in the deliverable.
+MAX_Q_TES = 169
+MIN_Q_TES = 40
+
+# CONSTANTS
+TES_OFF_MODE = 0
+TES_HEAT_MODE = HEAT_SEASON = 1
+TES_COOL_MODE = COOL_SEASON = -1
+TES_HEAT_OFF = 0 # control signal of TES charging in heating mode
+TES_PUMP_ON = 1
+TES_PUMP_OFF = 0
+SIMUL_END = 9504.0
+
+# controller driven by TRNSYS, see Controller
+CONTROLLER = None
+
+
+# --- END OF GLOBAL VARIABLES ---
+
+# function called by TRNSYS (Type169)
+def main():
+   try:
+      timestep = TRNSYS.getSimulationTime() # requires modified Type169 that allows to read the timestep in the Python environment
+      outputs = CONTROLLER.step(timestep, [TRNSYS.getInputValue(i) for i in range(1, 9)])
+      for i, value in enumerate(outputs, 1):
+         TRNSYS.setOutputValue(i, value)
+
+   except Exception as err:
+      log(traceback.format_exc()) # logs error
+      log(CONTROLLER.st_on)
+      flushSinks() # the buffered output files are complete up to the error
+      raise err
+
+# State of one controlled TES (inputs of the last timestep, decisions and outputs), stepped once per TRNSYS call.
+# The parameters and input files are the module globals above; main() steps the CONTROLLER instance
+class Controller:
+   __slots__ = ("current_step",
+                "day_of_year", "current_soc", "current_pv", "current_el_tot", "current_demand", "t1_bot", "t_mix_out", "total_q_tes",
+                "st_on", "selected_tes_charge_mode", "current_pv_over", "sea_total_q_tes", "target_soc",
+                "tes_heat_on", "tes_cool_on", "sc2", "demand_day")
+
+   def __init__(self):
+      # TIME
+      self.current_step = 0.0
+
+      # INPUTS with initial values
+      self.day_of_year = 0
+      self.current_soc = 0
+      self.current_pv = 0
+      self.current_el_tot = 0
+      self.current_demand = 0
+      self.t1_bot = 0
+      self.t_mix_out = 0
+      self.total_q_tes = 0
+
+      # INTERMEDIATES (values computed at each timestep which are not outputs nor inputs)
+      self.st_on = {}
+      self.selected_tes_charge_mode = TES_OFF_MODE
+      self.current_pv_over = 0
+      self.sea_total_q_tes = 0 # seasonal Q in TES
+      self.target_soc = 0
+
+      # OUTPUTS
+      self.tes_heat_on = 0 # control signal of TES charging in heating mode
+      self.tes_cool_on = 0 # control signal of TES charging in cooling mode
+      self.sc2 = 0 # regulates the TES PUMP
+      self.demand_day = 0 # daily demand 
+
+   # one call of TRNSYS at timestep with the TRNSYS inputs (SOC, DAY_OF_YEAR, PV, DEMAND, EL_TOT, T1_BOT, T_MIX_OUT, TOTAL_Q_TES).
+   # The logic runs on the inputs of the previous call; returns the outputs (TES_HEAT_ON, TES_COOL_ON, SC2, DEMAND_DAY)
+   def step(self, timestep, inputs):
+      # avoid executing logic multiple times for timestep because in the deck there are loops and this function will be called multiple times per timestep
+      if self.current_step != timestep: 
+         self.compute() # main logic
+         # prints in control.csv
+         pprint(self.current_step, self.current_soc, self.day_of_year, self.current_pv, self.tes_heat_on, self.tes_cool_on, self.selected_tes_charge_mode, self.sc2, self.demand_day, self.current_pv_over, self.current_demand, self.t1_bot, self.t_mix_out, self.total_q_tes, self.sea_total_q_tes, self.target_soc)
+      self.current_soc, self.day_of_year, self.current_pv, self.current_demand, self.current_el_tot, self.t1_bot, self.t_mix_out, self.total_q_tes = inputs
+
+      self.current_step = timestep
+
+      return self.tes_heat_on, self.tes_cool_on, self.sc2, self.demand_day
+
+   # main logic
+   def compute(self):
+      self.prepareIntermediates()
+      # TES charging time is decided once per day at DECISION_HOUR
+      print(self.current_step)
+      if self.current_step.is_integer() and self.current_step % 24 == DECISION_HOUR: 
+         self.decideTESChargingPred()
+      self.setTESMode()
+      self.setPumpMode()
+
+
+   def prepareIntermediates(self):
+      if self.day_of_year != 0:
+         self.demand_day = DEMANDS_DAY[self.day_of_year]
+      self.current_pv_over = max(0, self.current_pv - self.current_el_tot)
+    
+      self.sea_total_q_tes = self.total_q_tes - MIN_Q_TES if self.getDemandType() == HEAT_SEASON else MAX_Q_TES - self.total_q_tes # from 0 to MAX_Q_TES-MIN_Q_TES
+      self.target_soc = (1 + self.demand_day/(MAX_Q_TES-MIN_Q_TES))/2
+      self.target_soc = min(max(MIN_SOC, self.target_soc), MAX_SOC)
+
+
+   # Prediction mode: pick the best time period (PV_SPAN) in the next 24h to charge the TES
+   # Decides when to charge the TES and in which mode (SELECTED_TES_CHARGE_MODE)
+   def decideTESChargingPred(self):
+      # time variable to check from CURRENT_STEP to CURRENT_STEP + PREDICTION HORIZON (e.g., 24h)
+      time = self.current_step
+      endtime = min(time + PREDICTION_HORIZON, SIMUL_END)
+      st_on = self.st_on = {}
+      # predicted PV overproduction of each time step of the horizon, read once (None if not predicted).
+      # a run of overproduction can be scanned up to the time step at endtime, hence the extra steps
+      firstkey = getTimeStepKey(time)
+      stopkey = getTimeStepKey(endtime) + 2
+      pvs, pvs_present = PVS.horizon(firstkey, stopkey)
+      el_decs, el_decs_present = EL_DECS.horizon(firstkey, stopkey)
+      pv_overs = [pv - (el_dec + MIN_PV) if pv_present and el_dec_present else None
+                  for pv, el_dec, pv_present, el_dec_present in zip(pvs, el_decs, pvs_present, el_decs_present)]
+      pv_overs += [None] * (stopkey - firstkey - len(pv_overs)) # past the end of the forecasts
+      # number of consecutive time steps with overproduction starting at each time step (maximal runs, one backward pass)
+      runs = [0] * (len(pv_overs) + 1)
+      for i in range(len(pv_overs) - 1, -1, -1):
+         # if pv_over_predicted is less than zero we dont have overproduction and the run stops
+         if pv_overs[i] is not None and pv_overs[i] >= 0:
+            runs[i] = runs[i+1] + 1
+      # offsets accumulated step by step like time, so that the comparisons with endtime and PV_SPAN_MIN are unchanged
+      offsets = [0]
+      for i in range(len(pv_overs)):
+         offsets.append(offsets[-1] + STEP)
+
+      while time < endtime:
+         # overproduction run starting at time, cut at the end of the horizon
+         span = runs[getTimeStepKey(time) - firstkey]
+         while span and time + offsets[span-1] >= endtime:
+            span -= 1
+         if time + offsets[span] < endtime and pv_overs[getTimeStepKey(time) - firstkey + span] is None:
+            log("key not in", getTimeStepKey(time) + span)
+         offset = offsets[span]
+         starttime = time
+         while getTimeStepKey(time) < getTimeStepKey(starttime+offset) and time < endtime:
+            decision = offset >= PV_SPAN_MIN
+            st_on[getTimeStepKey(time)] = decision
+            pston(time, decision)
+            time += STEP
+         
+         time = min(time, endtime)
+         timestepkey = getTimeStepKey(time)
+         log(timestepkey, time)
+         st_on[timestepkey] = False
+         pston(time, False)
+         time += STEP
+      
+      self.selected_tes_charge_mode = TES_HEAT_MODE if self.getDemandType() == HEAT_SEASON else TES_COOL_MODE
+ 
+
+   # set the TES control signal at each time step (action, not decision)
+   def setTESMode(self):
+      self.tes_cool_on = self.tes_heat_on = 0
+      
+      # if we are in the time to charge the TES and TES is not fully charged
+      if self.st_on and self.st_on[getTimeStepKey(self.current_step)]:
+         if self.selected_tes_charge_mode == TES_HEAT_MODE and self.current_soc <= self.target_soc:
+            self.tes_heat_on = 1
+         elif self.selected_tes_charge_mode == TES_COOL_MODE and self.current_soc >= self.target_soc:
+            self.tes_cool_on = 1
+         
+      # stop charging if fully charged
+      if self.selected_tes_charge_mode == TES_HEAT_MODE and self.current_soc > self.target_soc:
+         self.st_on = {}
+         self.selected_tes_charge_mode = TES_HEAT_OFF
+      elif self.selected_tes_charge_mode == TES_COOL_MODE and self.current_soc < self.target_soc:
+         self.st_on = {}
+         self.selected_tes_charge_mode = TES_HEAT_OFF
+
+
+   def setPumpMode(self):
+      soc_discharged = self.current_soc <= SOC_DISCHARGED_HEAT if self.getDemandType() == HEAT_SEASON else self.current_soc >= SOC_DISCHARGED_COOL
+      # in heating TES is discharged if the temperature inside the TES is lower than distribution temperature (viceversa in cooling)
+      temp_discharged = self.t1_bot <= self.t_mix_out if self.getDemandType() == HEAT_SEASON else self.t1_bot >= self.t_mix_out
+
+      if self.tes_heat_on or self.tes_cool_on: # pump open in CHARGING MODE
+         self.sc2 = TES_PUMP_ON
+      elif not self.current_pv_over and self.current_demand and not soc_discharged and not temp_discharged: # pump open in DISCHARGING MODE for user needs
+         self.sc2 = TES_PUMP_ON
+      else:
+         self.sc2 = TES_PUMP_OFF
+
+   def getDemandType(self):
+      return HEAT_SEASON if self.demand_day >= 0 else COOL_SEASON
+   
+   
+def getTimeStepKey(timestep):
+   return int(round(float(timestep)*10,1))
+
+def setupFiles():
+   global DEMANDS_DAY, PVS, EL_DECS
+   DEMANDS_DAY = dict(loadSeries(DEMAND_PATH, "day").items())
+
+   PVS = loadSeries(PV_PATH, "step")
+
+   EL_DECS = loadSeries(EL_DEC_PATH, "step")
+
+def log(*args):
+   F_LOG.write(",".join([str(a) for a in args])+"\n")
+
+def pprint(*args):
+   F_PRINT.row(args)
+
+def logston(*args):
+   ST_ON_PRINT.write(",".join([str(a) for a in args])+"\n")
+
+def pston(time, decision):
+   timestepkey = getTimeStepKey(time)
+   pv_predicted = PVS[timestepkey]
+   el_dec_predicted = EL_DECS[timestepkey]
+   pv_over_predicted = max(0, pv_predicted - (el_dec_predicted + MIN_PV))
+   logston(time, decision, pv_over_predicted, pv_predicted, el_dec_predicted)
+ 
+
+# initialization
+setupFiles()
+CONTROLLER = Controller()
+F_PRINT.header("CURRENT_STEP,CURRENT_SOC,DAY_OF_YEAR,CURRENT_PV,TES_HEAT_ON,TES_COOL_ON,SELECTED_TES_CHARGE_MODE,SC2,DEMAND_DAY,CURRENT_PV_OVER,CURRENT_DEMAND,T1_BOT,T_MIX_OUT,TOTAL_Q_TES,SEA_TOT_Q_TES,TARGET_SOC")
+logston("TIME,ST_ON,PV_OVER_PRED,PV_PRED,EL_DEC_PRED")
+
+
+### --- DEBUG SECTION !DO NOT TOUCH! ---
+
+class TRNSYS_MOCK:
+   i = 0.0
+   def getInputValue(self, *args):
+      return 10
+   def setOutputValue(self,*args):
+      pass
+   def getSimulationTime(self):
+      self.i += 1
+      return self.i
+
+# settings DANGEROUS. DO NOT CHANGE. SHOULD BE FALSE
+DEBUG = False
+if DEBUG:   
+   TRNSYS = TRNSYS_MOCK()
+else:
+   import TRNSYSpy as TRNSYS
+
+if DEBUG:
+   for i in range(9504):
+      main()
+ 
\ No newline at end of file
@@ -0,0 +1,190 @@
+import importlib.util
+import contextlib
+import array
+import argparse
+import logsink
+import engine
+import plant
+import time
+import csv
+import sys
+import os
+
+# Stand-in for the read-only context of the bridge (TRNSYSpy.getContext), read from its ReplayTRNSYS.
+# The replay makes no calls at the end of the time steps nor at the last call (END_CALLS)
+class ReplayContext:
+   __slots__ = ("trnsys",)
+
+   def __init__(self, trnsys):
+      self.trnsys = trnsys
+
+   unit = property(lambda self: self.trnsys.unit)
+   type = property(lambda self: 169)
+   timestep = property(lambda self: self.trnsys.timestep)
+   start = property(lambda self: self.trnsys.start)
+   stop = property(lambda self: self.trnsys.stop)
+   parameters = property(lambda self: self.trnsys.parameters)
+   first_call = property(lambda self: self.trnsys.calls == 1)
+   end_of_timestep = property(lambda self: False)
+   last_call = property(lambda self: False)
+
+# Stand-in for the TRNSYSpy module of Type1691: the controller reads the inputs and the simulation time set by
+# the replay and its outputs are kept in memory. parameters: those of the unit in the deck, the number of inputs
+# and of outputs (the sizes of the shared arrays) and the input tolerance of the skipped calls (negative: none).
+# timestep, start, stop: the simulation times of the deck the inputs were recorded in (the context)
+class ReplayTRNSYS:
+   def __init__(self, parameters=(8, 4, -1.0), unit=1, timestep=engine.STEP, start=0.0, stop=engine.PARAMETERS["SIMUL_END"]):
+      self.unit = unit
+      self.timestep = timestep
+      self.start = start
+      self.stop = stop
+      self.context = ReplayContext(self)
+      self.time = 0.0
+      self.inputs = ()
+      self.parameters = tuple(parameters)
+      self.outputs = {}
+      # shared input and output arrays, and whether the controller holds a view of them
+      self.input_buffer = array.array('d', bytes(8 * int(self.parameters[0])))
+      self.output_buffer = array.array('d', bytes(8 * int(self.parameters[1])))
+      self.inputs_shared = self.outputs_shared = False
+      # time and inputs of the last call, and the number of calls made
+      self.last = None
+      self.calls = 0
+
+   # one call of the controller function as the bridge makes it: skipped if the time is the same and no input has
+   # changed by more than the tolerance (the outputs stay as set), else the inputs copied into the shared input array
+   # before, the outputs read back from the shared output array after
+   def call(self, function):
+      tolerance = self.parameters[2] if len(self.parameters) > 2 else -1.0
+      if tolerance >= 0:
+         if self.last and self.last[0] == self.time and all(abs(a - b) <= tolerance for a, b in zip(self.inputs, self.last[1])):
+            return
+         self.last = (self.time, tuple(self.inputs))
+      self.calls += 1
+      if self.inputs_shared:
+         self.input_buffer[:len(self.inputs)] = array.array('d', self.inputs[:len(self.input_buffer)])
+      function()
+      if self.outputs_shared:
+         self.outputs.update(enumerate(self.output_buffer, 1))
+
+   def getSimulationTime(self):
+      return self.time
+
+   def getCurrentUnit(self):
+      return self.unit
+
+   def getContext(self):
+      return self.context
+
+   def getInputValue(self, i):
+      return self.inputs[i-1]
+
+   def getParameterValue(self, i):
+      return self.parameters[i-1]
+
+   def setOutputValue(self, i, value):
+      self.outputs[i] = value
+
+   # bulk exchange of the bridge: all the inputs in one call, the outputs 1, 2, ... in one call
+   def getInputValues(self):
+      return tuple(self.inputs)
+
+   def setOutputValues(self, values):
+      self.outputs.update(enumerate(values, 1))
+
+   # views of the shared arrays
+   def getInputBuffer(self):
+      self.inputs_shared = True
+      return memoryview(self.input_buffer).toreadonly()
+
+   def getOutputBuffer(self):
+      self.outputs_shared = True
+      return memoryview(self.output_buffer)
+
+# recorded inputs: csv rows of the simulation time followed by the TRNSYS inputs in their order
+# (SOC, DAY_OF_YEAR, PV, DEMAND, EL_TOT, T1_BOT, T_MIX_OUT, TOTAL_Q_TES). An optional header row is skipped
+def readTrace(path):
+   with open(path, mode='r', newline='') as f:
+      rows = list(csv.reader(f))
+   if rows and not rows[0][0].lstrip("-").replace(".", "", 1).isdigit():
+      rows = rows[1:]
+   return [tuple(float(value) for value in row) for row in rows]
+
+# imports the controller script as TRNSYS does (its directory added to the search path), with `trnsys` as its
+# TRNSYSpy module. the script opens its input and output files at import, relative to workdir (the deck directory)
+def loadController(path, trnsys, workdir="."):
+   path = os.path.abspath(path)
+   if os.path.dirname(path) not in sys.path:
+      sys.path.append(os.path.dirname(path))
+   sys.modules["TRNSYSpy"] = trnsys
+   spec = importlib.util.spec_from_file_location("%s_%d" % (os.path.basename(path)[:-3], id(trnsys)), path)
+   module = importlib.util.module_from_spec(spec)
+   cwd = os.getcwd()
+   os.chdir(workdir)
+   try:
+      spec.loader.exec_module(module)
+   finally:
+      os.chdir(cwd)
+   return module
+
+# calls `call` (the main() of a controller) `iterations` times per timestep of the trace, with the time and inputs of
+# the timestep in trnsys, and returns the rows (time, output 1, output 2, ...) as set at the end of each timestep.
+# tes: plant of a closed loop (see replay), or None
+def drive(call, trnsys, trace, iterations=3, tes=None):
+   outputs = []
+   for row in trace:
+      trnsys.time = row[0]
+      trnsys.inputs = tes.inputs(row[1:]) if tes else row[1:]
+      for _ in range(iterations):
+         trnsys.call(call)
+      if tes:
+         tes.update(trnsys.outputs, row[1:])
+      outputs.append((row[0],) + tuple(trnsys.outputs[i] for i in sorted(trnsys.outputs)))
+   return outputs
+
+# runs the controller over the recorded inputs, calling it `iterations` times per timestep like the deck does,
+# and returns the rows (time, output 1, output 2, ...) as set at the end of each timestep.
+# the output files of the controller (control.csv, ...) are written in workdir.
+# closed loop: `model` builds the plant from the loaded controller (e.g. plant.TESPlant.forController); the plant then
+# supplies SOC, EL_TOT, T1_BOT and TOTAL_Q_TES at each timestep and is advanced by the outputs of the controller.
+# parameters: {global: value} set on the controller after import (e.g. {"PV_SPAN_MIN": 1.0}), on its ENGINE for APCS.py
+# tolerance: input tolerance of the bridge under which the calls of an iteration are skipped (negative: none)
+def replay(controller, trace, workdir=".", iterations=3, function="main", quiet=True, model=None, parameters=None, tolerance=-1.0):
+   trnsys = ReplayTRNSYS((8, 4, tolerance))
+   with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+      module = loadController(controller, trnsys, workdir)
+      controller_engine = getattr(module, "ENGINE", None)
+      for name, value in (parameters or {}).items():
+         if controller_engine is not None and name in engine.PARAMETERS:
+            setattr(controller_engine, name.lower(), value)
+         elif hasattr(module, name):
+            setattr(module, name, value)
+         else:
+            raise AttributeError("%s has no parameter %s" % (os.path.basename(controller), name))
+      outputs = drive(getattr(module, function), trnsys, trace, iterations, model(module) if model else None)
+   logsink.flushSinks()
+   return outputs
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Runs an APCS controller outside TRNSYS on recorded inputs")
+   parser.add_argument("controller", help="controller script, e.g. APCS5.py")
+   parser.add_argument("trace", help="csv of the recorded inputs: time, then the TRNSYS inputs in order")
+   parser.add_argument("--workdir", default=".", help="directory of the controller input files, where its output files are written")
+   parser.add_argument("--iterations", type=int, default=3, help="calls per timestep (TRNSYS iterations)")
+   parser.add_argument("--output", help="csv file of the outputs set at each timestep")
+   parser.add_argument("--closed-loop", action="store_true", help="simulate the TES (plant.py) instead of replaying the recorded SOC, EL_TOT, T1_BOT and TOTAL_Q_TES")
+   parser.add_argument("--soc", type=float, default=0.5, help="initial SOC of the simulated TES")
+   parser.add_argument("--tolerance", type=float, default=-1.0, help="skip the calls of an iteration whose inputs changed by at most this (bridge parameter 3)")
+   args = parser.parse_args()
+
+   trace = readTrace(args.trace)
+   start = time.perf_counter()
+   model = (lambda module: plant.TESPlant.forController(module, soc=args.soc)) if args.closed_loop else None
+   outputs = replay(args.controller, trace, args.workdir, args.iterations, model=model, tolerance=args.tolerance)
+   elapsed = time.perf_counter() - start
+   print("%d timesteps in %.2fs (%.0f timesteps/s)" % (len(outputs), elapsed, len(outputs) / elapsed))
+   if args.output:
+      with open(args.output, mode='w', newline='') as f:
+         writer = csv.writer(f)
+         writer.writerow(["TIME"] + ["OUTPUT_%d" % i for i in range(1, len(outputs[0]) if outputs else 1)])
+         writer.writerows(outputs)
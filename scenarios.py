@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import logsink
+import replay
+import plant
+import shutil
+import json
+import time
+import csv
+import os
+
+# input files a controller opens at import (see setupFiles of the APCS scripts)
+INPUTS = ["PV_PRO.csv", "BUI_LOAD_norm.csv", "BUI_LOAD_day.csv", "EL_DEC.csv", "PRICE.csv"]
+SUMMARY = ["name", "controller", "timesteps", "heat_on_h", "cool_on_h", "pump_on_h", "hp_kwh", "final_soc", "wall_time", "error"]
+
+# A scenario is a dict:
+#  name        output directory under the output root, holding the controller output files and outputs.csv
+#  controller  controller script (e.g. "APCS5.py")
+#  trace       csv of the recorded inputs (see replay.readTrace)
+#  inputdir    directory of the input files (default "."), and/or
+#  inputs      {input file name: path} for the input files taken elsewhere (e.g. {"PRICE.csv": "tariffs/2023.csv"})
+#  parameters  {global of the controller: value} set after import, e.g. {"PV_SPAN_MIN": 1.0, "DECISION_HOUR": 6}.
+#              Only values read by the logic at each step apply, not the file names and sinks set up at import
+#  closed_loop simulate the TES with plant.TESPlant (default false), starting at `soc` (default 0.5)
+#  iterations  calls per timestep (default 3)
+
+# fills the output directory of the scenario with the input files of the controller, linked where possible
+def prepare(scenario, outdir):
+   os.makedirs(outdir, exist_ok=True)
+   inputs = {name: os.path.join(scenario.get("inputdir", "."), name) for name in INPUTS}
+   inputs.update(scenario.get("inputs", {}))
+   for name, path in inputs.items():
+      # the binary cache of the input (timeseries.py) follows it
+      for source, target in ((path, name), (path + ".bin", name + ".bin")):
+         target = os.path.join(outdir, target)
+         if not os.path.exists(source):
+            continue
+         if os.path.lexists(target):
+            os.remove(target)
+         try:
+            os.symlink(os.path.abspath(source), target)
+         except OSError: # no symlinks (e.g. Windows without privilege)
+            shutil.copyfile(source, target)
+
+# runs in a worker process: one scenario in its own output directory, returns its row of the summary
+def run(scenario, root):
+   outdir = os.path.join(root, scenario["name"])
+   row = {"name": scenario["name"], "controller": scenario["controller"]}
+   start = time.perf_counter()
+   try:
+      prepare(scenario, outdir)
+      trace = replay.readTrace(scenario["trace"])
+      plants = []
+      def model(module):
+         plants.append(plant.TESPlant.forController(module, soc=scenario.get("soc", 0.5)))
+         return plants[-1]
+      outputs = replay.replay(scenario["controller"], trace, outdir, scenario.get("iterations", 3),
+                              model=model if scenario.get("closed_loop") else None, parameters=scenario.get("parameters"))
+   except Exception as err:
+      row["error"] = repr(err)
+      return row
+   finally:
+      # the next scenario of this worker opens its own output files
+      logsink.closeSinks()
+      del logsink.SINKS[:]
+   row["wall_time"] = time.perf_counter() - start
+
+   with open(os.path.join(outdir, "outputs.csv"), mode='w', newline='') as f:
+      writer = csv.writer(f)
+      writer.writerow(["TIME"] + ["OUTPUT_%d" % i for i in range(1, len(outputs[0]) if outputs else 1)])
+      writer.writerows(outputs)
+   step = outputs[1][0] - outputs[0][0] if len(outputs) > 1 else 0
+   row["timesteps"] = len(outputs)
+   for column, i in (("heat_on_h", 1), ("cool_on_h", 2), ("pump_on_h", 3)):
+      row[column] = sum(1 for output in outputs if output[i]) * step
+   if plants:
+      row["hp_kwh"] = (row["heat_on_h"] + row["cool_on_h"]) * plants[0].hp_power / 1000
+      row["final_soc"] = float(plants[0].soc[0])
+   return row
+
+# runs the scenarios across a pool of `workers` processes (one controller per scenario, so scenarios never
+# share module state) and returns the summary rows in the order of the scenarios
+def runAll(scenarios, root, workers=None):
+   names = [scenario["name"] for scenario in scenarios]
+   if len(set(names)) != len(names):
+      raise ValueError("scenario names must be unique, they name the output directories")
+   context = multiprocessing.get_context("spawn")
+   with ProcessPoolExecutor(workers, mp_context=context) as executor:
+      futures = [executor.submit(run, scenario, root) for scenario in scenarios]
+      rows = []
+      for future in futures:
+         rows.append(future.result())
+         row = rows[-1]
+         print("%s: %s" % (row["name"], row["error"] if "error" in row else "%d timesteps in %.2fs" % (row["timesteps"], row["wall_time"])))
+   return rows
+
+# scenarios file: a json list of scenarios, or {"defaults": {...}, "scenarios": [...]} where each scenario
+# extends the defaults (parameters and inputs are merged)
+def readScenarios(path):
+   with open(path, mode='r') as f:
+      spec = json.load(f)
+   if isinstance(spec, list):
+      return spec
+   defaults = spec.get("defaults", {})
+   scenarios = []
+   for scenario in spec["scenarios"]:
+      merged = dict(defaults, **scenario)
+      for key in ("parameters", "inputs"):
+         merged[key] = dict(defaults.get(key, {}), **scenario.get(key, {}))
+      scenarios.append(merged)
+   return scenarios
+
+def writeSummary(rows, path):
+   with open(path, mode='w', newline='') as f:
+      writer = csv.DictWriter(f, SUMMARY)
+      writer.writeheader()
+      writer.writerows(rows)
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Runs APCS controller scenarios in parallel on the offline simulator")
+   parser.add_argument("scenarios", help="json file of the scenarios")
+   parser.add_argument("--output", default="scenarios", help="root directory of the scenario output directories")
+   parser.add_argument("--workers", type=int, help="worker processes (default: cpu count)")
+   args = parser.parse_args()
+
+   rows = runAll(readScenarios(args.scenarios), args.output, args.workers)
+   writeSummary(rows, os.path.join(args.output, "summary.csv"))
+   print("summary: %s" % os.path.join(args.output, "summary.csv"))
+   if any("error" in row for row in rows):
+      raise SystemExit(1)
@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import struct
+import array
+import mmap
+import csv
+import sys
+import os
+
+# step number of a row of the input csv files: tenths of hour for the forecasts, rounded (same as floatRound of
+# APCS2..APCS6) or truncated (same as getTimeStepKey of APCS1), and day of year for the demands.
+# the two differ on times stored just below a step, e.g. 2.2999999999999998 is step 23 rounded and 22 truncated
+KEYS = {
+   "step": lambda time: int(round(float(time)*10,1)),
+   "truncate": lambda time: int(float(time)*10),
+   "day": int,
+}
+
+# Time series of a controller input (PV_PRO.csv, EL_DEC.csv, PRICE.csv) stored in contiguous buffers
+# and indexed directly by step number, i.e. by the timestep key of the controllers (tenths of hour).
+# It reads like the dicts it replaces: `key in series` and `series[key]` (KeyError if the value is missing),
+# and horizon(start, stop) gives zero-copy views of the values and of the mask of present values
+class TimeSeries:
+   __slots__ = ("values", "present")
+
+   def __init__(self, values, present):
+      self.values = memoryview(values)
+      self.present = memoryview(present)
+
+   # reads a csv of (time, value) rows, key turns the time into the step number
+   @classmethod
+   def fromCsv(cls, path, key):
+      with open(path, mode='r') as f:
+         rows = [(key(row[0]), float(row[1])) for row in csv.reader(f)]
+      size = max((k for k, _ in rows), default=-1) + 1
+      values = array.array('d', bytes(8 * size))
+      present = bytearray(size)
+      for k, value in rows:
+         values[k] = value
+         present[k] = 1
+      return cls(values, present)
+
+   def __contains__(self, key):
+      return 0 <= key < len(self.present) and self.present[key] == 1
+
+   def __getitem__(self, key):
+      if not (0 <= key < len(self.present) and self.present[key] == 1):
+         raise KeyError(key)
+      return self.values[key]
+
+   # values and presence mask of the steps start..stop-1, without copy.
+   # the views stop at the last stored step, so they can be shorter than stop-start
+   def horizon(self, start, stop):
+      return self.values[start:stop], self.present[start:stop]
+
+   # (step number, value) of the present values
+   def items(self):
+      return [(k, self.values[k]) for k in range(len(self.present)) if self.present[k] == 1]
+
+   @property
+   def nbytes(self):
+      return self.values.nbytes + self.present.nbytes
+
+# mask (one byte per value) of the `count` lowest values: the indices are sorted by value once, ties going to
+# the earliest index (the sort is stable), so exactly min(count, len(values)) values are selected
+def lowestMask(values, count):
+   mask = bytearray(len(values))
+   for i in sorted(range(len(values)), key=values.__getitem__)[:max(count, 0)]:
+      mask[i] = 1
+   return mask
+
+# BINARY CACHE
+# "<csv>.bin" holds a fixed-width header, then the values as little-endian float64 and the presence mask (one byte per step).
+# the header identifies the source csv by size, mtime and sha256, so that a stale cache is never mapped
+HEADER = struct.Struct("<8s8sQqQ32s8x") # magic, key, source size, source mtime (ns), step count, source sha256
+MAGIC = b"APCSTS1\0"
+
+def cachePath(path):
+   return path + ".bin"
+
+def sourceHash(path):
+   with open(path, mode='rb') as f:
+      return hashlib.sha256(f.read()).digest()
+
+# converts the csv into its binary cache (build step, see __main__)
+def buildCache(path, key):
+   series = TimeSeries.fromCsv(path, KEYS[key])
+   values = array.array('d', series.values)
+   if sys.byteorder == "big":
+      values.byteswap()
+   stat = os.stat(path)
+   header = HEADER.pack(MAGIC, key.encode(), stat.st_size, stat.st_mtime_ns, len(values), sourceHash(path))
+   with open(cachePath(path) + ".tmp", mode='wb') as f:
+      f.write(header)
+      f.write(values.tobytes())
+      f.write(series.present)
+   os.replace(cachePath(path) + ".tmp", cachePath(path))
+
+# maps the binary cache of the csv, or returns None if there is none or it is stale.
+# the cache is valid if the csv has the recorded size and mtime, or else the recorded sha256 (e.g. csv copied again unchanged)
+def mapCache(path, key):
+   try:
+      with open(cachePath(path), mode='rb') as f:
+         cache = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      stat = os.stat(path)
+   except (OSError, ValueError): # ValueError: empty file
+      return None
+   if len(cache) < HEADER.size or sys.byteorder == "big":
+      return None
+   magic, cache_key, size, mtime, count, sha256 = HEADER.unpack_from(cache)
+   if magic != MAGIC or cache_key.rstrip(b"\0") != key.encode() or len(cache) != HEADER.size + 9 * count:
+      return None
+   if (size, mtime) != (stat.st_size, stat.st_mtime_ns) and sha256 != sourceHash(path):
+      return None
+   data = memoryview(cache)
+   return TimeSeries(data[HEADER.size:HEADER.size + 8 * count].cast('d'), data[HEADER.size + 8 * count:])
+
+# input series for the controllers: mapped from the binary cache when it is up to date, else parsed from the csv
+def loadSeries(path, key):
+   return mapCache(path, key) or TimeSeries.fromCsv(path, KEYS[key])
+
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description="Builds the binary caches of the controller input csv files")
+   parser.add_argument("--step", nargs="*", default=["PV_PRO.csv", "EL_DEC.csv", "PRICE.csv"], help="csv files of (time, value) rows")
+   parser.add_argument("--truncate", nargs="*", default=[], help="csv files of (time, value) rows read with truncated time keys (APCS1)")
+   parser.add_argument("--day", nargs="*", default=["BUI_LOAD_norm.csv", "BUI_LOAD_day.csv"], help="csv files of (day, value) rows")
+   args = parser.parse_args()
+
+   for key, paths in (("step", args.step), ("truncate", args.truncate), ("day", args.day)):
+      for path in paths:
+         if os.path.exists(path):
+            buildCache(path, key)
+            print("%s -> %s" % (path, cachePath(path)))
+         else:
+            print("%s not found, skipped" % path)